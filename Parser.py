@@ -1,7 +1,25 @@
+import argparse
+import base64
+import hashlib
+import json
 import os
+import pickle
+import re
 import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
 import graphviz
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, redirect_stdout
+
+# Cambia cada vez que cambia el formato o el contenido de las tablas; forma
+# parte de la llave del caché de compilación
+GENERATOR_VERSION = "8"
 
 class Token:
     def __init__(self, type, value=None, position=None):
@@ -15,191 +33,432 @@ class Token:
         return f"{self.type} at {self.position}"
 
 class YALexParser:
+    # Lector de especificaciones .yal en una sola pasada: un índice avanza
+    # sobre el texto y cada sección (header, let, keywords, rule/and,
+    # trailer) se reconoce en su lugar, sin reconstruir el contenido. Las
+    # búsquedas usan expresiones compiladas para saltar tramos completos
+    # en vez de avanzar carácter por carácter.
+    BLANK = re.compile(r'\s*')
+    COMMENT_MARK = re.compile(r'\(\*|\*\)')
+    BRACE_MARK = re.compile(r'[{}]|\(\*')
+    REGEX_MARK = re.compile(r"[{'\"\[]|\(\*")
+    DEFINITION_MARK = re.compile(r"[{'\"\[]|\(\*|\b(?:let|keywords|rule)\b")
+    CLASS_MARK = re.compile(r"[\]\\']")
+    STRING_MARK = re.compile(r'["\\]')
+    # Caso común de una regla completa: expresión y acción sin comentarios
+    # y acción sin llaves internas; lo demás pasa por read_regex/read_braces
+    SIMPLE_RULE = re.compile(r"""((?:[^{'"\[(]|\((?!\*)|'\\?.'|"(?:\\.|[^"\\])*"|\[(?:\\.|'\\?.'|[^\]\\'])*\])*)\{((?:[^{}(]|\((?!\*))*)\}\s*""",
+                             re.S)
+    
     def __init__(self, file_path):
         self.file_path = file_path
         self.content = None
+        self.pos = 0
         self.definitions = {}
         self.rules = []
+        self.keywords = {}
         self.header = None
         self.trailer = None
     
     def parse(self):
         with open(self.file_path, 'r') as file:
             self.content = file.read()
+        self.pos = 0
         
-        self.remove_comments()
-        self.extract_header()
-        self.extract_trailer()
-        self.extract_definitions()
-        
-        rule_section = self.extract_rule_section()
-        if rule_section:
-            entrypoint, args, rules_text = rule_section
-            self.extract_rules(rules_text)
-            
-            return {
-                'header': self.header,
-                'trailer': self.trailer,
-                'definitions': self.definitions,
-                'entrypoint': entrypoint,
-                'args': args,
-                'rules': self.rules
-            }
-        
-        return None
-    
-    def remove_comments(self):
-        result = []
-        i = 0
-        n = len(self.content)
+        self.skip_blank()
+        if self.peek() == '{':
+            self.header = self.read_braces().strip()
+            self.skip_blank()
         
-        while i < n:
-            if i + 1 < n and self.content[i] == '(' and self.content[i+1] == '*':
-                i += 2
-                while i < n and not (self.content[i] == '*' and i+1 < n and self.content[i+1] == ')'):
-                    i += 1
-                i += 2
-            else:
-                result.append(self.content[i])
-                i += 1
+        while self.at_word("let"):
+            self.pos += 3
+            ident = self.expect_ident("definition name")
+            self.expect('=')
+            self.definitions[ident] = self.read_regex(self.DEFINITION_MARK)
         
-        self.content = ''.join(result)
-    
-    def extract_header(self):
-        i = 0
-        n = len(self.content)
+        while self.at_word("keywords"):
+            self.pos += 8
+            self.read_keywords()
         
-        while i < n and self.content[i].isspace():
-            i += 1
+        if not self.at_word("rule"):
+            if self.pos < len(self.content):
+                raise self.error("Expected 'rule'")
+            return None
         
-        if i < n and self.content[i] == '{':
-            i += 1
-            start = i
-            while i < n and self.content[i] != '}':
-                i += 1
+        # rule tokens = ... and comment = ...
+        # Cada bloque adicional (como en ocamllex) es un modo del lexer
+        entrypoints = []
+        keyword = "rule"
+        while keyword:
+            self.pos += len(keyword)
+            entrypoint = self.expect_ident("entrypoint name")
+            args = None
+            if self.peek() == '[':
+                close = self.content.find(']', self.pos)
+                if close == -1:
+                    raise self.error("Unterminated entrypoint arguments")
+                args = self.content[self.pos + 1:close].strip()
+                self.pos = close + 1
+                self.skip_blank()
+            self.expect('=')
             
-            if i < n:
-                self.header = self.content[start:i].strip()
-                self.content = self.content[i+1:].strip()
-    
-    def extract_trailer(self):
-        i = len(self.content) - 1
+            start = len(self.rules)
+            keyword = self.read_rules()
+            entrypoints.append((entrypoint, args, start, len(self.rules)))
         
-        while i >= 0 and self.content[i].isspace():
-            i -= 1
+        return {
+            'header': self.header,
+            'trailer': self.trailer,
+            'definitions': self.definitions,
+            'keywords': self.keywords,
+            'entrypoint': entrypoints[0][0],
+            'args': entrypoints[0][1],
+            'entrypoints': entrypoints,
+            'rules': self.rules
+        }
+    
+    def read_rules(self):
+        # Alternativas "regexp { acción }" separadas por '|'; pueden ocupar
+        # varias líneas. Devuelve la palabra que abre el siguiente bloque
+        # ("and") o None al terminar; un '{' suelto al final es el trailer
+        if self.peek() == '|':
+            self.pos += 1
         
-        if i >= 0 and self.content[i] == '}':
-            end = i
-            i -= 1
-            while i >= 0 and self.content[i] != '{':
-                i -= 1
+        while True:
+            match = self.SIMPLE_RULE.match(self.content, self.pos)
+            if match:
+                self.rules.append((match.group(1).strip(), match.group(2).strip()))
+                self.pos = match.end()
+            else:
+                regexp = self.read_regex(self.REGEX_MARK)
+                if self.peek() != '{':
+                    raise self.error(f"Missing action for rule {regexp!r}")
+                self.rules.append((regexp, self.read_braces().strip()))
+            self.skip_blank()
             
-            if i >= 0:
-                self.trailer = self.content[i+1:end].strip()
-                self.content = self.content[:i].strip()
+            char = self.peek()
+            if char == '|':
+                self.pos += 1
+            elif self.at_word("and"):
+                return "and"
+            elif self.at_word("rule"):
+                return "rule"
+            elif char == '{':
+                self.trailer = self.read_braces().strip()
+                self.skip_blank()
+                if self.pos < len(self.content):
+                    raise self.error("Unexpected text after the trailer")
+                return None
+            elif char is None:
+                return None
+            else:
+                raise self.error("Expected '|' between rules")
+    
+    def read_keywords(self):
+        # keywords ID = "if" { return IF } | "then" { return THEN } ...
+        # Cada bloque reclasifica los lexemas de la regla cuyo token es ID
+        token = self.expect_ident("keywords token")
+        self.expect('=')
+        table = self.keywords.setdefault(token, [])
+        
+        while True:
+            if self.peek() == '|':
+                self.pos += 1
+                self.skip_blank()
+            quote = self.peek()
+            if quote is None or quote not in '"\'':
+                break
+            close = self.content.find(quote, self.pos + 1)
+            if close == -1:
+                raise self.error("Unterminated keyword")
+            word = self.content[self.pos + 1:close]
+            self.pos = close + 1
+            self.skip_blank()
+            if self.peek() != '{':
+                raise self.error(f"Missing action for keyword {word!r}")
+            table.append((word, self.read_braces().strip()))
+            self.skip_blank()
     
-    def extract_definitions(self):
+    def read_regex(self, marks):
+        # Texto de una expresión hasta '{' o una palabra clave, saltando
+        # literales, clases y comentarios; los comentarios no se copian
         content = self.content
-        i = 0
         n = len(content)
+        parts = []
+        start = self.pos
         
-        while i < n:
-            if i + 3 < n and content[i:i+3] == "let" and (i == 0 or content[i-1].isspace()):
-                i += 3
-                while i < n and content[i].isspace():
-                    i += 1
-                
-                start_ident = i
-                while i < n and (content[i].isalnum() or content[i] == '_'):
-                    i += 1
-                ident = content[start_ident:i].strip()
-                
-                while i < n and content[i].isspace():
-                    i += 1
-                
-                if i < n and content[i] == '=':
-                    i += 1
-                    while i < n and content[i].isspace():
-                        i += 1
-                    
-                    start_def = i
-                    while i < n:
-                        if (i + 3 < n and content[i:i+3] == "let" and content[i-1].isspace()) or \
-                           (i + 4 < n and content[i:i+4] == "rule" and content[i-1].isspace()):
-                            break
-                        i += 1
-                    
-                    regexp = content[start_def:i].strip()
-                    self.definitions[ident] = regexp
-            else:
-                i += 1
-        
-        remaining_content = ""
-        i = 0
-        while i < n:
-            if i + 4 < n and content[i:i+4] == "rule" and (i == 0 or content[i-1].isspace()):
-                remaining_content = content[i:]
+        while True:
+            match = marks.search(content, self.pos)
+            if not match:
+                self.pos = n
+                break
+            self.pos = match.start()
+            mark = match.group()
+            if mark == '{' or mark[0].isalpha():
                 break
-            i += 1
+            if mark == '(*':
+                parts.append(content[start:self.pos])
+                self.skip_comment()
+                parts.append(' ')
+                start = self.pos
+            elif mark == "'":
+                self.pos = self.quoted_char_end(self.pos)
+            elif mark == '"':
+                self.pos = self.string_end(self.pos)
+            else:
+                self.pos = self.class_end(self.pos)
         
-        self.content = remaining_content
+        parts.append(content[start:self.pos])
+        return ''.join(parts).strip()
     
-    def extract_rule_section(self):
+    def read_braces(self):
+        # Bloque {...} con llaves balanceadas; devuelve el texto interior.
+        # Como en read_regex, los comentarios no se copian y sus llaves no
+        # cuentan
         content = self.content
-        i = 0
-        n = len(content)
-        
-        if i + 4 < n and content[i:i+4] == "rule":
-            i += 4
-            while i < n and content[i].isspace():
-                i += 1
-            
-            start_entry = i
-            while i < n and (content[i].isalnum() or content[i] == '_'):
-                i += 1
-            entrypoint = content[start_entry:i].strip()
-            
-            args = None
-            if i < n and content[i] == '[':
-                i += 1
-                start_args = i
-                while i < n and content[i] != ']':
-                    i += 1
-                if i < n:
-                    args = content[start_args:i].strip()
-                    i += 1
-            
-            while i < n and content[i].isspace():
-                i += 1
-            
-            if i < n and content[i] == '=':
+        opening = self.pos
+        parts = []
+        start = self.pos + 1
+        depth = 0
+        while True:
+            match = self.BRACE_MARK.search(content, self.pos)
+            if not match:
+                raise self.error("Unterminated '{'", opening)
+            mark = match.group()
+            if mark == '(*':
+                parts.append(content[start:match.start()])
+                self.pos = match.start()
+                self.skip_comment()
+                parts.append(' ')
+                start = self.pos
+                continue
+            self.pos = match.end()
+            depth += 1 if mark == '{' else -1
+            if not depth:
+                parts.append(content[start:match.start()])
+                return ''.join(parts)
+    
+    def quoted_char_end(self, i):
+        # 'c' o '\c'; una comilla suelta se toma como un carácter más
+        content = self.content
+        close = i + (3 if content[i + 1:i + 2] == '\\' else 2)
+        if content[close:close + 1] == "'":
+            return close + 1
+        return i + 1
+    
+    def string_end(self, i):
+        i += 1
+        while True:
+            match = self.STRING_MARK.search(self.content, i)
+            if not match:
+                return len(self.content)
+            if match.group() == '"':
+                return match.end()
+            i = match.end() + 1
+    
+    def class_end(self, i):
+        i += 1
+        while True:
+            match = self.CLASS_MARK.search(self.content, i)
+            if not match:
+                return len(self.content)
+            mark = match.group()
+            if mark == ']':
+                return match.end()
+            if mark == "'":
+                i = self.quoted_char_end(match.start())
+            else:
+                i = match.end() + 1
+    
+    def skip_comment(self):
+        # (* ... *), anidables como en ocamllex
+        depth = 0
+        for match in self.COMMENT_MARK.finditer(self.content, self.pos):
+            depth += 1 if match.group() == '(*' else -1
+            if not depth:
+                self.pos = match.end()
+                return
+        self.pos = len(self.content)
+    
+    def skip_blank(self):
+        while True:
+            self.pos = self.BLANK.match(self.content, self.pos).end()
+            if not self.content.startswith('(*', self.pos):
+                break
+            self.skip_comment()
+    
+    def peek(self):
+        return self.content[self.pos] if self.pos < len(self.content) else None
+    
+    @staticmethod
+    def is_ident_char(char):
+        return char.isalnum() or char == '_'
+    
+    def at_word(self, word):
+        end = self.pos + len(word)
+        return (self.content.startswith(word, self.pos) and
+                (end >= len(self.content) or not self.is_ident_char(self.content[end])))
+    
+    def expect_ident(self, what):
+        self.skip_blank()
+        start = self.pos
+        while self.pos < len(self.content) and self.is_ident_char(self.content[self.pos]):
+            self.pos += 1
+        if start == self.pos:
+            raise self.error(f"Expected {what}")
+        ident = self.content[start:self.pos]
+        self.skip_blank()
+        return ident
+    
+    def expect(self, char):
+        self.skip_blank()
+        if self.peek() != char:
+            raise self.error(f"Expected {char!r}")
+        self.pos += 1
+        self.skip_blank()
+    
+    def error(self, message, pos=None):
+        pos = self.pos if pos is None else pos
+        line = self.content.count('\n', 0, pos) + 1
+        return ValueError(f"{self.file_path}:{line}: {message}")
+
+class CharSet:
+    # Conjunto de caracteres guardado como intervalos cerrados (lo, hi) de
+    # code points, ordenados y sin solapamientos
+    MAX_CODE_POINT = 0x10FFFF
+    
+    def __init__(self, ranges=()):
+        merged = []
+        for lo, hi in sorted(ranges):
+            if merged and lo <= merged[-1][1] + 1:
+                if hi > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], hi)
+            else:
+                merged.append((lo, hi))
+        self.ranges = tuple(merged)
+        self._hash = hash(self.ranges)
+    
+    @staticmethod
+    def from_chars(chars):
+        return CharSet((ord(char), ord(char)) for char in chars)
+    
+    @staticmethod
+    def universe():
+        return CharSet([(0, CharSet.MAX_CODE_POINT)])
+    
+    def __eq__(self, other):
+        return isinstance(other, CharSet) and self.ranges == other.ranges
+    
+    def __hash__(self):
+        return self._hash
+    
+    def __lt__(self, other):
+        return self.ranges < other.ranges
+    
+    def __contains__(self, char):
+        code = ord(char)
+        for lo, hi in self.ranges:
+            if code < lo:
+                return False
+            if code <= hi:
+                return True
+        return False
+    
+    def __len__(self):
+        return sum(hi - lo + 1 for lo, hi in self.ranges)
+    
+    def __bool__(self):
+        return bool(self.ranges)
+    
+    def __repr__(self):
+        return f"CharSet({self})"
+    
+    def __str__(self):
+        if self.ranges == ((0, CharSet.MAX_CODE_POINT),):
+            return '_'
+        if len(self.ranges) == 1 and self.ranges[0][0] == self.ranges[0][1]:
+            return self._label(self.ranges[0][0])
+        parts = []
+        for lo, hi in self.ranges:
+            if lo == hi:
+                parts.append(self._label(lo))
+            elif hi == lo + 1:
+                parts.append(self._label(lo) + self._label(hi))
+            else:
+                parts.append(f"{self._label(lo)}-{self._label(hi)}")
+        return f"[{''.join(parts)}]"
+    
+    def _label(self, code):
+        char = chr(code)
+        if char in '[]-\\':
+            return '\\' + char
+        if char.isprintable() and char != ' ':
+            return char
+        return repr(char)[1:-1] if char != ' ' else '\\s'
+    
+    def union(self, other):
+        return CharSet(self.ranges + other.ranges)
+    
+    def intersection(self, other):
+        ranges = []
+        i = j = 0
+        while i < len(self.ranges) and j < len(other.ranges):
+            lo = max(self.ranges[i][0], other.ranges[j][0])
+            hi = min(self.ranges[i][1], other.ranges[j][1])
+            if lo <= hi:
+                ranges.append((lo, hi))
+            if self.ranges[i][1] < other.ranges[j][1]:
                 i += 1
-                rules_text = content[i:].strip()
-                return entrypoint, args, rules_text
-        
-        return None
+            else:
+                j += 1
+        return CharSet(ranges)
+    
+    def complement(self):
+        # Respecto a todo el espacio de code points, no solo ASCII
+        ranges = []
+        start = 0
+        for lo, hi in self.ranges:
+            if lo > start:
+                ranges.append((start, lo - 1))
+            start = hi + 1
+        if start <= CharSet.MAX_CODE_POINT:
+            ranges.append((start, CharSet.MAX_CODE_POINT))
+        return CharSet(ranges)
     
-    def extract_rules(self, rules_text):
-        lines = rules_text.split('\n')
-        current_rule = ""
+    def difference(self, other):
+        return self.intersection(other.complement())
+    
+    def chars(self):
+        for lo, hi in self.ranges:
+            for code in range(lo, hi + 1):
+                yield chr(code)
+    
+    @staticmethod
+    def atoms(edges):
+        # Parte las etiquetas de varias aristas (CharSet, bitmask destino) en
+        # átomos disjuntos y agrupa los átomos que llevan a los mismos
+        # destinos: devuelve {bitmask destino: CharSet}
+        events = defaultdict(list)
+        for charset, destinations in edges:
+            for lo, hi in charset.ranges:
+                events[lo].append((True, destinations))
+                events[hi + 1].append((False, destinations))
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith(('|', '')) and '{' in line and '}' in line:
-                if line.startswith('|'):
-                    line = line[1:].strip()
-                
-                # Buscar donde empieza la acción
-                brace_start = line.find('{')
-                brace_end = line.find('}')
-                
-                if brace_start != -1 and brace_end != -1:
-                    regexp = line[:brace_start].strip()
-                    action = line[brace_start+1:brace_end].strip()
-                    self.rules.append((regexp, action))
+        active = defaultdict(int)
+        groups = defaultdict(list)
+        points = sorted(events)
+        for i, point in enumerate(points[:-1]):
+            for opening, destinations in events[point]:
+                active[destinations] += 1 if opening else -1
+                if not active[destinations]:
+                    del active[destinations]
+            if active:
+                mask = 0
+                for destinations in active:
+                    mask |= destinations
+                groups[mask].append((point, points[i + 1] - 1))
+        
+        return {mask: CharSet(ranges) for mask, ranges in groups.items()}
 
 class RegexNode:
     def __init__(self, type, value=None, left=None, right=None):
@@ -219,6 +478,10 @@ class RegexNode:
 class RegexParser:
     def __init__(self, definitions=None):
         self.definitions = definitions or {}
+        # Árboles ya parseados de las definiciones; los nodos no se
+        # modifican después de construirse, así que se comparten entre
+        # todas las referencias
+        self.definition_trees = {}
         self.pos = 0
         self.input = ""
 
@@ -230,33 +493,156 @@ class RegexParser:
             raise ValueError(f"Invalid regex: {regex}. Result: {result}")
         return result
 
+    def parse_definition(self, ident):
+        tree = self.definition_trees.get(ident)
+        if tree is not None:
+            return tree
+
+        # DFS iterativo sobre las referencias: cada definición se parsea
+        # después de sus dependencias, así nunca se parsea una dentro de
+        # otra; volver a una que está en el camino actual es un ciclo
+        path = [ident]
+        pending = [iter(self.definition_references(ident))]
+        while pending:
+            dependency = next(pending[-1], None)
+            if dependency is None:
+                pending.pop()
+                name = path.pop()
+                saved_input, saved_pos = self.input, self.pos
+                try:
+                    self.definition_trees[name] = self.parse(self.definitions[name])
+                finally:
+                    self.input, self.pos = saved_input, saved_pos
+            elif dependency in path:
+                cycle = path[path.index(dependency):] + [dependency]
+                raise ValueError(f"Recursive definition: {' -> '.join(cycle)}")
+            elif dependency not in self.definition_trees:
+                path.append(dependency)
+                pending.append(iter(self.definition_references(dependency)))
+
+        return self.definition_trees[ident]
+
+    def definition_references(self, ident):
+        return self.references(self.definitions[ident])
+
+    def dependencies(self, text):
+        # Todas las definiciones que el texto alcanza en el grafo de
+        # dependencias, directa o indirectamente
+        found = set()
+        pending = self.references(text)
+        while pending:
+            name = pending.pop()
+            if name not in found:
+                found.add(name)
+                pending.extend(self.definition_references(name))
+        return found
+
+    def references(self, text):
+        # Identificadores de definiciones usados en el texto, saltando
+        # literales y clases de caracteres igual que parse_atom
+        references = []
+        i = 0
+        while i < len(text):
+            char = text[i]
+            if char == "'":
+                i += 3 if text[i + 1:i + 2] == '\\' else 2
+                if text[i:i + 1] == "'":
+                    i += 1
+            elif char in '"[':
+                close = '"' if char == '"' else ']'
+                i += 1
+                while i < len(text) and text[i] != close:
+                    i += 2 if text[i] == '\\' else 1
+                i += 1
+            elif char.isalnum():
+                start = i
+                while i < len(text) and (text[i].isalnum() or text[i] == '_'):
+                    i += 1
+                name = text[start:i]
+                if name in self.definitions and name not in references:
+                    references.append(name)
+            else:
+                i += 1
+        return references
+
     def parse_regex(self):
-        left = self.parse_term()
-        if self.pos < len(self.input) and self.input[self.pos] == '|':
-            self.pos += 1
-            right = self.parse_regex()
-            return RegexNode('UNION', left=left, right=right)
-        return left
+        # Pila explícita de grupos abiertos en vez de recursión: cada marco
+        # guarda las alternativas ya cerradas, los factores del término en
+        # curso y los operandos izquierdos de '#' pendientes
+        frames = [([], [], [])]
+        while True:
+            alternatives, factors, diffs = frames[-1]
+            self.skip_space()
+            char = self.input[self.pos] if self.pos < len(self.input) else None
 
-    def parse_term(self):
-        factors = []
-        while self.pos < len(self.input) and self.input[self.pos] not in '|)':
-            factors.append(self.parse_factor())
+            if char == '(':
+                self.pos += 1
+                frames.append(([], [], []))
+                continue
 
-        if not factors:
-            return RegexNode('CHAR', value='ε')
+            if char == '|':
+                self.pos += 1
+                alternatives.append(self._close_term(factors, diffs))
+                continue
 
-        if len(factors) == 1:
-            return factors[0]
+            if char is None or char == ')':
+                alternatives.append(self._close_term(factors, diffs))
+                group = self.balanced('UNION', alternatives)
+                if len(frames) == 1:
+                    # Un ')' sin abrir termina la expresión, sin consumirse
+                    return group
+                frames.pop()
+                if char == ')':
+                    self.pos += 1
+                factor = group
+            else:
+                factor = self.parse_atom()
 
-        result = factors[0]
-        for factor in factors[1:]:
-            result = RegexNode('CONCAT', left=result, right=factor)
-        return result
+            self.skip_space()
+            postfixed = self.parse_postfix(factor)
+            alternatives, factors, diffs = frames[-1]
+            self.skip_space()
+            if postfixed is factor and self.pos < len(self.input) and self.input[self.pos] == '#':
+                self.pos += 1
+                diffs.append(factor)
+                continue
+            factor = postfixed
+            while diffs:
+                factor = RegexNode('DIFF', left=diffs.pop(), right=factor)
+            factors.append(factor)
+
+    def skip_space(self):
+        # Fuera de literales el espacio solo separa, también entre los
+        # elementos de una clase (un espacio literal se escribe ' ' o dentro
+        # de "..."), así las reglas pueden ocupar varias líneas
+        while self.pos < len(self.input) and self.input[self.pos].isspace():
+            self.pos += 1
+
+    def _close_term(self, factors, diffs):
+        if diffs:
+            factor = RegexNode('CHAR', value='ε')
+            while diffs:
+                factor = RegexNode('DIFF', left=diffs.pop(), right=factor)
+            factors.append(factor)
+        if not factors:
+            return RegexNode('CHAR', value='ε')
+        term = self.balanced('CONCAT', factors)
+        del factors[:]
+        return term
 
-    def parse_factor(self):
-        atom = self.parse_atom()
+    @staticmethod
+    def balanced(type, nodes):
+        # Árbol binario balanceado: la profundidad crece con log(n), no con
+        # el número de alternativas o de factores concatenados
+        nodes = list(nodes)
+        while len(nodes) > 1:
+            paired = [RegexNode(type, left=nodes[i], right=nodes[i + 1]) for i in range(0, len(nodes) - 1, 2)]
+            if len(nodes) % 2:
+                paired.append(nodes[-1])
+            nodes = paired
+        return nodes[0]
 
+    def parse_postfix(self, atom):
         if self.pos < len(self.input):
             if self.input[self.pos] == '*':
                 self.pos += 1
@@ -267,11 +653,6 @@ class RegexParser:
             elif self.input[self.pos] == '?':
                 self.pos += 1
                 return RegexNode('OPTIONAL', left=atom)
-            elif self.input[self.pos] == '#':
-                self.pos += 1
-                right = self.parse_factor()
-                return RegexNode('DIFF', left=atom, right=right)
-
         return atom
 
     def parse_atom(self):
@@ -280,16 +661,9 @@ class RegexParser:
 
         char = self.input[self.pos]
 
-        if char == '(':
-            self.pos += 1
-            node = self.parse_regex()
-            if self.pos < len(self.input) and self.input[self.pos] == ')':
-                self.pos += 1
-            return node
-
         if char == '_':
             self.pos += 1
-            return RegexNode('CHARCLASS', value='ANY')
+            return RegexNode('CHARCLASS', value=CharSet.universe())
 
         if char == '[':
             self.pos += 1
@@ -298,56 +672,49 @@ class RegexParser:
                 negate = True
                 self.pos += 1
 
-            chars = set()
+            # La clase se arma como intervalos, sin enumerar sus caracteres.
+            # El espacio sin comillas solo separa elementos, salvo dentro de
+            # un tramo "..." como [" \t\n"], donde es un miembro más
+            ranges = []
+            in_string = False
+            self._class_space(in_string)
             while self.pos < len(self.input) and self.input[self.pos] != ']':
-                if self.input[self.pos] == '\\':
-                    self.pos += 1
-                    if self.pos < len(self.input):
-                        escaped = self.input[self.pos]
-                        if escaped == 't':
-                            chars.add('\t')
-                        elif escaped == 'n':
-                            chars.add('\n')
-                        elif escaped == 's':
-                            chars.add(' ')
-                        else:
-                            chars.add(escaped)
-                        self.pos += 1
-                    continue
-
-                start = self.input[self.pos]
-                self.pos += 1
-
+                if self.input[self.pos] == '"':
+                    in_string = not in_string
+                start = ord(self._class_char())
+                self._class_space(in_string)
                 if self.pos < len(self.input) and self.input[self.pos] == '-':
                     self.pos += 1
+                    self._class_space(in_string)
                     if self.pos < len(self.input) and self.input[self.pos] != ']':
-                        end = self.input[self.pos]
-                        self.pos += 1
-                        for c in range(ord(start), ord(end) + 1):
-                            chars.add(chr(c))
+                        end = ord(self._class_char())
+                        if end < start:
+                            raise ValueError(f"Invalid range in character class: {chr(start)!r}-{chr(end)!r}")
+                        ranges.append((start, end))
                     else:
-                        chars.add(start)
-                        chars.add('-')
+                        ranges.append((start, start))
+                        ranges.append((ord('-'), ord('-')))
                 else:
-                    chars.add(start)
+                    ranges.append((start, start))
+                self._class_space(in_string)
 
             if self.pos < len(self.input) and self.input[self.pos] == ']':
                 self.pos += 1
 
+            chars = CharSet(ranges)
+            if negate:
+                return RegexNode('CHARCLASS', value=chars.complement())
+
             if not chars:
                 return RegexNode('CHAR', value='ε')
 
-            if negate:
-                all_chars = set(chr(i) for i in range(32, 127))
-                chars = all_chars - chars
-
             return RegexNode('CHARCLASS', value=chars)
 
         if char == "'":
             self.pos += 1
             if self.pos < len(self.input):
-                char_value = self.input[self.pos]
-                self.pos += 1
+                # Mismos escapes que dentro de una clase: '\n', '\\', '\''
+                char_value = self._escaped_char()
                 if self.pos < len(self.input) and self.input[self.pos] == "'":
                     self.pos += 1
                 return RegexNode('CHAR', value=char_value)
@@ -379,13 +746,7 @@ class RegexParser:
             if not chars:
                 return RegexNode('CHAR', value='ε')
             
-            if len(chars) == 1:
-                return RegexNode('CHAR', value=chars[0])
-            
-            result = RegexNode('CHAR', value=chars[0])
-            for char in chars[1:]:
-                result = RegexNode('CONCAT', left=result, right=RegexNode('CHAR', value=char))
-            return result
+            return self.balanced('CONCAT', [RegexNode('CHAR', value=char) for char in chars])
 
         if char.isalnum() or char == '_':
             start = self.pos
@@ -393,15 +754,161 @@ class RegexParser:
                 self.pos += 1
 
             ident = self.input[start:self.pos]
-            if ident in self.definitions:
-                subparser = RegexParser(self.definitions)
-                return subparser.parse(self.definitions[ident])
-            else:
-                return RegexNode('CHAR', value=ident)
+            if ident not in self.definitions:
+                raise ValueError(f"Undefined identifier: {ident!r} (quote it to match it literally)")
+            return self.parse_definition(ident)
 
         self.pos += 1
         return RegexNode('CHAR', value=char)
 
+    def _class_space(self, in_string):
+        if not in_string:
+            self.skip_space()
+
+    def _class_char(self):
+        # Elemento de una clase: 'c' entre comillas o un carácter suelto
+        if self.input[self.pos] == "'":
+            close = self.pos + (3 if self.input[self.pos + 1:self.pos + 2] == '\\' else 2)
+            if self.input[close:close + 1] == "'":
+                self.pos += 1
+                char = self._escaped_char()
+                self.pos += 1
+                return char
+        return self._escaped_char()
+
+    def _escaped_char(self):
+        char = self.input[self.pos]
+        self.pos += 1
+        if char == '\\' and self.pos < len(self.input):
+            escaped = self.input[self.pos]
+            self.pos += 1
+            return {'t': '\t', 'n': '\n', 's': ' '}.get(escaped, escaped)
+        return char
+
+class RegexSimplifier:
+    # Reconstruye los árboles con nodos internados (hash-consing): dos
+    # subárboles iguales son el mismo objeto, incluso entre reglas. De paso
+    # aplica simplificaciones que no cambian el lenguaje:
+    #   a|b|[cd]  -> [abcd]        r|r  -> r
+    #   r|ε       -> r?            (r*)* , (r+)* , (r?)* -> r*
+    #   (r*)+ , (r?)+ , (r*)? , (r+)? -> r*
+    #   rε , εr   -> r
+    def __init__(self):
+        self.nodes = {}
+    
+    def node(self, type, value=None, left=None, right=None):
+        # Los hijos ya están internados, así que su id identifica el subárbol
+        key = (type, value, id(left), id(right))
+        node = self.nodes.get(key)
+        if node is None:
+            node = RegexNode(type, value, left, right)
+            self.nodes[key] = node
+        return node
+    
+    def simplify(self, root):
+        # Postorden con pila explícita; los subárboles compartidos (por
+        # ejemplo, definiciones) se simplifican una sola vez
+        done = {}
+        stack = [(root, False)]
+        
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in done:
+                continue
+            
+            children = [child for child in (node.left, node.right) if child is not None]
+            if not expanded and children:
+                stack.append((node, True))
+                for child in children:
+                    stack.append((child, False))
+                continue
+            
+            left = done[id(node.left)] if node.left is not None else None
+            right = done[id(node.right)] if node.right is not None else None
+            
+            if node.type == 'UNION':
+                result = self._union(left, right)
+            elif node.type == 'CONCAT':
+                if self._is_epsilon(left):
+                    result = right
+                elif self._is_epsilon(right):
+                    result = left
+                else:
+                    result = self.node('CONCAT', left=left, right=right)
+            elif node.type in ('STAR', 'PLUS', 'OPTIONAL'):
+                result = self._closure(node.type, left)
+            elif node.type == 'CHARCLASS' and len(node.value) == 1:
+                result = self.node('CHAR', value=next(node.value.chars()))
+            else:
+                result = self.node(node.type, node.value, left, right)
+            
+            done[id(node)] = result
+        
+        return done[id(root)]
+    
+    def _is_epsilon(self, node):
+        return node.type == 'CHAR' and node.value == 'ε'
+    
+    def _closure(self, type, inner):
+        if self._is_epsilon(inner):
+            return inner
+        if inner.type in ('STAR', 'PLUS', 'OPTIONAL'):
+            if inner.type == type:
+                return inner
+            if type == 'STAR' or inner.type == 'STAR' or {type, inner.type} == {'PLUS', 'OPTIONAL'}:
+                return self.node('STAR', left=inner.left)
+        return self.node(type, left=inner)
+    
+    def _union(self, left, right):
+        # Aplana las alternativas; r? aporta ε y r
+        alternatives = []
+        pending = [right, left]
+        while pending:
+            node = pending.pop()
+            if node.type == 'UNION':
+                pending.append(node.right)
+                pending.append(node.left)
+            elif node.type == 'OPTIONAL':
+                alternatives.append(self.node('CHAR', value='ε'))
+                pending.append(node.left)
+            else:
+                alternatives.append(node)
+        
+        nullable = False
+        has_class = False
+        chars = CharSet()
+        others = []
+        for alternative in alternatives:
+            if self._is_epsilon(alternative):
+                nullable = True
+            elif alternative.type == 'CHAR' and len(alternative.value) == 1:
+                chars = chars.union(CharSet.from_chars(alternative.value))
+            elif alternative.type == 'CHARCLASS':
+                has_class = True
+                chars = chars.union(alternative.value)
+            elif alternative not in others:
+                others.append(alternative)
+        
+        if chars or (has_class and not others):
+            if len(chars) == 1:
+                others.insert(0, self.node('CHAR', value=next(chars.chars())))
+            else:
+                others.insert(0, self.node('CHARCLASS', value=chars))
+        
+        if not others:
+            return self.node('CHAR', value='ε')
+        
+        while len(others) > 1:
+            paired = [self.node('UNION', left=others[i], right=others[i + 1]) for i in range(0, len(others) - 1, 2)]
+            if len(others) % 2:
+                paired.append(others[-1])
+            others = paired
+        result = others[0]
+        
+        if nullable:
+            result = self._closure('OPTIONAL', result)
+        return result
+
 class NFAState:
     def __init__(self, state_id):
         self.id = state_id
@@ -409,8 +916,11 @@ class NFAState:
         self.epsilon_transitions = set()
         self.is_accepting = False
         self.token_action = None
+        self.priority = None
     
     def add_transition(self, symbol, state):
+        if not isinstance(symbol, CharSet):
+            symbol = CharSet.from_chars(symbol)
         self.transitions[symbol].add(state)
     
     def add_epsilon_transition(self, state):
@@ -427,6 +937,51 @@ class NFA:
         self.states.append(state)
         return state
     
+    def to_compact(self):
+        # Forma serializable: (número de estados, inicial, aceptación,
+        # aristas (origen, intervalos, destino), aristas ε (origen, destino)).
+        # Se toma antes de combine, mientras los ids son los índices propios
+        edges = [(state.id, symbol.ranges, dest.id) for state in self.states
+                 for symbol, destinations in state.transitions.items() for dest in destinations]
+        epsilons = [(state.id, dest.id) for state in self.states for dest in state.epsilon_transitions]
+        accepts = sorted(state.id for state in self.accept_states)
+        return len(self.states), self.start_state.id, accepts, edges, epsilons
+    
+    @staticmethod
+    def from_compact(data):
+        count, start, accepts, edges, epsilons = data
+        nfa = NFA()
+        for _ in range(count):
+            nfa.create_state()
+        for source, ranges, dest in edges:
+            nfa.states[source].add_transition(CharSet(ranges), nfa.states[dest])
+        for source, dest in epsilons:
+            nfa.states[source].add_epsilon_transition(nfa.states[dest])
+        nfa.start_state = nfa.states[start]
+        for state_id in accepts:
+            nfa.states[state_id].is_accepting = True
+            nfa.accept_states.add(nfa.states[state_id])
+        return nfa
+    
+    def combine(self, nfas):
+        # Une varias NFAs bajo un nuevo estado inicial. Se copian los estados
+        # con ids únicos dentro de la combinación; las NFAs de entrada no se
+        # tocan, así que sus ids siguen siendo sus índices (y sus dibujos no
+        # cambian cuando cambia otra regla)
+        self.start_state = self.create_state()
+        for nfa in nfas:
+            copies = [self.create_state() for _ in nfa.states]
+            for state, copy in zip(nfa.states, copies):
+                for symbol, destinations in state.transitions.items():
+                    copy.transitions[symbol] = {copies[dest.id] for dest in destinations}
+                copy.epsilon_transitions = {copies[dest.id] for dest in state.epsilon_transitions}
+                copy.is_accepting = state.is_accepting
+                copy.token_action = state.token_action
+                copy.priority = state.priority
+            self.start_state.add_epsilon_transition(copies[nfa.start_state.id])
+            self.accept_states.update(copies[state.id] for state in nfa.accept_states)
+        return self
+    
     def epsilon_closure(self, states):
         if not isinstance(states, set):
             states = {states}
@@ -442,6 +997,146 @@ class NFA:
                     stack.append(next_state)
         
         return closure
+    
+    def epsilon_closure_mask(self, mask, table=None):
+        # Igual que epsilon_closure, pero sobre un bitmask de ids de estados
+        if table is not None:
+            closure = 0
+            while mask:
+                low = mask & -mask
+                closure |= table[low.bit_length() - 1]
+                mask ^= low
+            return closure
+        
+        closure = mask
+        stack = []
+        while mask:
+            low = mask & -mask
+            stack.append(low.bit_length() - 1)
+            mask ^= low
+        
+        while stack:
+            state = self.states[stack.pop()]
+            for next_state in state.epsilon_transitions:
+                bit = 1 << next_state.id
+                if not closure & bit:
+                    closure |= bit
+                    stack.append(next_state.id)
+        
+        return closure
+    
+    def epsilon_closure_table(self):
+        # Cerradura-ε de cada estado calculada una sola vez. Los ciclos de
+        # transiciones ε se condensan en componentes fuertemente conexas
+        # (Tarjan iterativo); Tarjan las emite en orden topológico inverso,
+        # así que los sucesores de una componente ya están resueltos.
+        n = len(self.states)
+        index = [-1] * n
+        lowlink = [0] * n
+        on_stack = [False] * n
+        component = [-1] * n
+        component_closure = []
+        stack = []
+        counter = 0
+        
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            work = [(root, iter(self.states[root].epsilon_transitions))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            
+            while work:
+                node, successors = work[-1]
+                advanced = False
+                for successor in successors:
+                    succ = successor.id
+                    if index[succ] == -1:
+                        index[succ] = lowlink[succ] = counter
+                        counter += 1
+                        stack.append(succ)
+                        on_stack[succ] = True
+                        work.append((succ, iter(successor.epsilon_transitions)))
+                        advanced = True
+                        break
+                    elif on_stack[succ]:
+                        lowlink[node] = min(lowlink[node], index[succ])
+                if advanced:
+                    continue
+                
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                
+                if lowlink[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = len(component_closure)
+                        members.append(member)
+                        if member == node:
+                            break
+                    
+                    closure = 0
+                    for member in members:
+                        closure |= 1 << member
+                    for member in members:
+                        for successor in self.states[member].epsilon_transitions:
+                            if component[successor.id] != component[member]:
+                                closure |= component_closure[component[successor.id]]
+                    component_closure.append(closure)
+        
+        return [component_closure[component[i]] for i in range(n)]
+    
+    def remove_epsilons(self, table=None):
+        # Construye un NFA equivalente sin transiciones ε: cada estado hereda
+        # las transiciones y la aceptación de su cerradura-ε
+        if table is None:
+            table = self.epsilon_closure_table()
+        
+        nfa = NFA()
+        mapping = {}
+        
+        def get_state(old):
+            if old.id not in mapping:
+                new = nfa.create_state()
+                best = None
+                closure = table[old.id]
+                while closure:
+                    low = closure & -closure
+                    member = self.states[low.bit_length() - 1]
+                    closure ^= low
+                    if member.is_accepting and (best is None or (member.priority is not None and
+                                                (best.priority is None or member.priority < best.priority))):
+                        best = member
+                if best is not None:
+                    new.is_accepting = True
+                    new.token_action = best.token_action
+                    new.priority = best.priority
+                    nfa.accept_states.add(new)
+                mapping[old.id] = new
+                pending.append(old)
+            return mapping[old.id]
+        
+        pending = []
+        nfa.start_state = get_state(self.start_state)
+        while pending:
+            old = pending.pop()
+            new = mapping[old.id]
+            closure = table[old.id]
+            while closure:
+                low = closure & -closure
+                member = self.states[low.bit_length() - 1]
+                closure ^= low
+                for symbol, destinations in member.transitions.items():
+                    for dest in destinations:
+                        new.add_transition(symbol, get_state(dest))
+        
+        return nfa
 
 class NFABuilder:
     def __init__(self):
@@ -455,71 +1150,74 @@ class NFABuilder:
         nfa.accept_states.add(end)
         return nfa
 
-    def _build_node(self, node, nfa):
+    def _build_node(self, root, nfa):
+        # Postorden con pila explícita. Los operadores que crean sus propios
+        # estados de inicio y fin los crean antes que los de sus hijos, en
+        # el mismo orden que la construcción recursiva de Thompson
+        results = []
+        stack = [(root, None)]
+        
+        while stack:
+            node, states = stack.pop()
+            
+            if states is None:
+                if node.type == 'CONCAT':
+                    stack.append((node, ()))
+                    stack.append((node.right, None))
+                    stack.append((node.left, None))
+                elif node.type in ('UNION', 'STAR', 'PLUS', 'OPTIONAL'):
+                    stack.append((node, (nfa.create_state(), nfa.create_state())))
+                    if node.type == 'UNION':
+                        stack.append((node.right, None))
+                    stack.append((node.left, None))
+                else:
+                    results.append(self._build_leaf(node, nfa))
+                continue
+            
+            if node.type == 'CONCAT':
+                right_start, right_end = results.pop()
+                left_start, left_end = results.pop()
+                left_end.add_epsilon_transition(right_start)
+                results.append((left_start, right_end))
+                continue
+            
+            start, end = states
+            if node.type == 'UNION':
+                right_start, right_end = results.pop()
+                left_start, left_end = results.pop()
+                start.add_epsilon_transition(left_start)
+                start.add_epsilon_transition(right_start)
+                left_end.add_epsilon_transition(end)
+                right_end.add_epsilon_transition(end)
+            else:
+                sub_start, sub_end = results.pop()
+                start.add_epsilon_transition(sub_start)
+                if node.type != 'PLUS':
+                    start.add_epsilon_transition(end)
+                if node.type != 'OPTIONAL':
+                    sub_end.add_epsilon_transition(sub_start)
+                sub_end.add_epsilon_transition(end)
+            results.append((start, end))
+        
+        return results.pop()
+
+    def _build_leaf(self, node, nfa):
         if node.type == 'CHAR':
             start = nfa.create_state()
             end = nfa.create_state()
             if node.value != 'ε':
-                start.add_transition(node.value, end)
+                start.add_transition(CharSet.from_chars(node.value), end)
             else:
                 start.add_epsilon_transition(end)
             return start, end
 
-        elif node.type == 'CONCAT':
-            left_start, left_end = self._build_node(node.left, nfa)
-            right_start, right_end = self._build_node(node.right, nfa)
-            left_end.add_epsilon_transition(right_start)
-            return left_start, right_end
-
-        elif node.type == 'UNION':
-            start = nfa.create_state()
-            end = nfa.create_state()
-            left_start, left_end = self._build_node(node.left, nfa)
-            right_start, right_end = self._build_node(node.right, nfa)
-            start.add_epsilon_transition(left_start)
-            start.add_epsilon_transition(right_start)
-            left_end.add_epsilon_transition(end)
-            right_end.add_epsilon_transition(end)
-            return start, end
-
-        elif node.type == 'STAR':
-            start = nfa.create_state()
-            end = nfa.create_state()
-            sub_start, sub_end = self._build_node(node.left, nfa)
-            start.add_epsilon_transition(sub_start)
-            start.add_epsilon_transition(end)
-            sub_end.add_epsilon_transition(sub_start)
-            sub_end.add_epsilon_transition(end)
-            return start, end
-
-        elif node.type == 'PLUS':
-            start = nfa.create_state()
-            end = nfa.create_state()
-            sub_start, sub_end = self._build_node(node.left, nfa)
-            start.add_epsilon_transition(sub_start)
-            sub_end.add_epsilon_transition(sub_start)
-            sub_end.add_epsilon_transition(end)
-            return start, end
-
-        elif node.type == 'OPTIONAL':
-            start = nfa.create_state()
-            end = nfa.create_state()
-            sub_start, sub_end = self._build_node(node.left, nfa)
-            start.add_epsilon_transition(sub_start)
-            start.add_epsilon_transition(end)
-            sub_end.add_epsilon_transition(end)
-            return start, end
-
         elif node.type == 'CHARCLASS':
             start = nfa.create_state()
             end = nfa.create_state()
             
-            if isinstance(node.value, set):
-                for char in node.value:
-                    start.add_transition(char, end)
-            elif node.value == 'ANY':
-                for i in range(32, 127):
-                    start.add_transition(chr(i), end)
+            # Una sola arista etiquetada con el conjunto, no una por carácter
+            if node.value:
+                start.add_transition(node.value, end)
             
             return start, end
 
@@ -529,17 +1227,14 @@ class NFABuilder:
         return start, end
 
 class DFAState:
-    def __init__(self, state_id, nfa_states):
+    def __init__(self, state_id, nfa_states, accepting=None):
         self.id = state_id
+        # Bitmask con los ids de los estados del NFA que representa
         self.nfa_states = nfa_states
         self.transitions = {}
-        self.is_accepting = any(state.is_accepting for state in nfa_states)
-        self.token_action = None
-        
-        for state in nfa_states:
-            if state.is_accepting and state.token_action:
-                self.token_action = state.token_action
-                break
+        self.is_accepting = accepting is not None
+        self.token_action = accepting.token_action if accepting else None
+        self.priority = accepting.priority if accepting else None
 
 class DFA:
     def __init__(self):
@@ -547,62 +1242,483 @@ class DFA:
         self.start_state = None
         self.accept_states = set()
     
-    def create_state(self, nfa_states):
-        state = DFAState(len(self.states), nfa_states)
+    def create_state(self, nfa_states, accepting=None):
+        state = DFAState(len(self.states), nfa_states, accepting)
         self.states.append(state)
         if state.is_accepting:
             self.accept_states.add(state)
         return state
+    
+    def to_compact(self):
+        # Forma serializable sin referencias entre objetos: pickle no recorre
+        # recursivamente el grafo de estados, por largo que sea
+        states = [(state.nfa_states, state.is_accepting, state.token_action, state.priority)
+                  for state in self.states]
+        edges = [(state.id, symbol.ranges, dest.id) for state in self.states
+                 for symbol, dest in state.transitions.items()]
+        return self.start_state.id, states, edges
+    
+    @staticmethod
+    def from_compact(data):
+        start, states, edges = data
+        dfa = DFA()
+        for nfa_states, is_accepting, token_action, priority in states:
+            state = dfa.create_state(nfa_states)
+            state.is_accepting = is_accepting
+            state.token_action = token_action
+            state.priority = priority
+            if is_accepting:
+                dfa.accept_states.add(state)
+        for source, ranges, dest in edges:
+            dfa.states[source].transitions[CharSet(ranges)] = dfa.states[dest]
+        dfa.start_state = dfa.states[start]
+        return dfa
+
+class DFABudgetExceeded(ValueError):
+    pass
 
 class NFAToDFAConverter:
-    def __init__(self):
+    def __init__(self, max_states=None, max_transitions=None):
         self.alphabet = set()
+        self.max_states = max_states
+        self.max_transitions = max_transitions
+    
+    def _accepting_state(self, nfa, mask):
+        # Si varias reglas aceptan, gana la que aparece primero en el archivo
+        best = None
+        mask &= self.accept_mask
+        while mask:
+            low = mask & -mask
+            state = nfa.states[low.bit_length() - 1]
+            mask ^= low
+            if best is None or (state.priority is not None and
+                                (best.priority is None or state.priority < best.priority)):
+                best = state
+        return best
     
     def convert(self, nfa):
         self.alphabet = set()
+        
+        # Transiciones de cada estado del NFA como (símbolo, bitmask destino)
+        self.accept_mask = 0
+        moves_table = []
         for state in nfa.states:
-            for symbol in state.transitions.keys():
-                if symbol != 'ε':
-                    self.alphabet.add(symbol)
+            if state.is_accepting:
+                self.accept_mask |= 1 << state.id
+            moves_table.append([
+                (symbol, sum(1 << dest.id for dest in destinations))
+                for symbol, destinations in state.transitions.items()
+            ])
+        
+        closure_table = nfa.epsilon_closure_table()
         
         dfa = DFA()
-        start_closure = nfa.epsilon_closure(nfa.start_state)
-        dfa.start_state = dfa.create_state(start_closure)
+        start_closure = nfa.epsilon_closure_mask(1 << nfa.start_state.id, closure_table)
+        dfa.start_state = dfa.create_state(start_closure, self._accepting_state(nfa, start_closure))
         
-        unprocessed = [dfa.start_state]
-        state_map = {frozenset(start_closure): dfa.start_state}
+        unprocessed = deque([dfa.start_state])
+        state_map = {start_closure: dfa.start_state}
+        transition_count = 0
         
         while unprocessed:
-            current = unprocessed.pop(0)
+            current = unprocessed.popleft()
             
-            for symbol in self.alphabet:
-                next_nfa_states = set()
-                
-                for nfa_state in current.nfa_states:
-                    if symbol in nfa_state.transitions:
-                        next_nfa_states.update(nfa_state.transitions[symbol])
+            # Reunir en una sola pasada las aristas que realmente salen del
+            # estado y partir sus clases de caracteres en átomos disjuntos
+            edges = []
+            members = current.nfa_states
+            while members:
+                low = members & -members
+                members ^= low
+                edges.extend(moves_table[low.bit_length() - 1])
+            moves = CharSet.atoms(edges)
+            
+            for destinations, symbol in sorted(moves.items(), key=lambda move: move[1]):
+                self.alphabet.add(symbol)
+                epsilon_closure = nfa.epsilon_closure_mask(destinations, closure_table)
                 
-                epsilon_closure = set()
-                for state in next_nfa_states:
-                    epsilon_closure.update(nfa.epsilon_closure(state))
+                next_state = state_map.get(epsilon_closure)
+                if next_state is None:
+                    next_state = dfa.create_state(epsilon_closure, self._accepting_state(nfa, epsilon_closure))
+                    state_map[epsilon_closure] = next_state
+                    unprocessed.append(next_state)
+                    if self.max_states is not None and len(dfa.states) > self.max_states:
+                        raise DFABudgetExceeded(f"more than {self.max_states} states")
                 
-                if not epsilon_closure:
+                current.transitions[symbol] = next_state
+                transition_count += 1
+                if self.max_transitions is not None and transition_count > self.max_transitions:
+                    raise DFABudgetExceeded(f"more than {self.max_transitions} transitions")
+        
+        return dfa
+    
+    def merge(self, dfas):
+        # Une los DFAs de bloques disjuntos de reglas determinizando su unión
+        # como NFA: cada subconjunto tiene a lo más un estado de cada DFA y
+        # corresponde a uno solo del DFA de todas las reglas juntas, así que
+        # el resultado es el mismo DFA, con los mismos estados y numeración
+        nfa = NFA()
+        nfa.start_state = nfa.create_state()
+        for dfa in dfas:
+            copies = [nfa.create_state() for _ in dfa.states]
+            for state, copy in zip(dfa.states, copies):
+                for symbol, dest in state.transitions.items():
+                    copy.add_transition(symbol, copies[dest.id])
+                if state.is_accepting:
+                    copy.is_accepting = True
+                    copy.token_action = state.token_action
+                    copy.priority = state.priority
+                    nfa.accept_states.add(copy)
+            nfa.start_state.add_epsilon_transition(copies[dfa.start_state.id])
+        return self.convert(nfa)
+
+class DFAMinimizer:
+    # Minimización de Hopcroft. La partición inicial separa los estados de
+    # aceptación por su token_action, así que nunca se mezclan reglas
+    # distintas; los estados muertos se eliminan antes de particionar.
+    def minimize(self, dfa):
+        live = self._live_states(dfa)
+        states = [state for state in dfa.states if state.id in live or state is dfa.start_state]
+        index = {state.id: i for i, state in enumerate(states)}
+        n = len(states)
+        sink = n
+        
+        # Alfabeto común: intervalos elementales de todas las etiquetas,
+        # agrupados en clases que se comportan igual en todos los estados
+        points = set()
+        for state in states:
+            for symbol in state.transitions:
+                for lo, hi in symbol.ranges:
+                    points.add(lo)
+                    points.add(hi + 1)
+        bounds = sorted(points)
+        
+        columns = [[] for _ in bounds]
+        for i, state in enumerate(states):
+            for symbol, dest in state.transitions.items():
+                if dest.id not in index:
                     continue
+                for lo, hi in symbol.ranges:
+                    for k in range(bisect_left(bounds, lo), bisect_left(bounds, hi + 1)):
+                        columns[k].append((i, index[dest.id]))
+        symbols = {}
+        for column in columns:
+            if column:
+                symbols.setdefault(tuple(column), None)
+        
+        # Índice inverso: inverse[c][destino] = orígenes; las transiciones
+        # ausentes van a un sumidero explícito
+        inverse = []
+        for column in symbols:
+            predecessors = [[] for _ in range(n + 1)]
+            targets = [sink] * (n + 1)
+            for source, dest in column:
+                targets[source] = dest
+            for source, dest in enumerate(targets):
+                predecessors[dest].append(source)
+            inverse.append(predecessors)
+        
+        initial = defaultdict(list)
+        for i, state in enumerate(states):
+            initial[(True, state.token_action) if state.is_accepting else (False, None)].append(i)
+        initial[(False, None)].append(sink)
+        
+        blocks = []
+        block_of = [0] * (n + 1)
+        for members in initial.values():
+            for member in members:
+                block_of[member] = len(blocks)
+            blocks.append(set(members))
+        
+        pending = deque(range(len(blocks)))
+        in_pending = set(pending)
+        
+        while pending:
+            splitter = pending.popleft()
+            in_pending.discard(splitter)
+            splitter_states = list(blocks[splitter])
+            
+            for predecessors in inverse:
+                touched = defaultdict(set)
+                for dest in splitter_states:
+                    for source in predecessors[dest]:
+                        touched[block_of[source]].add(source)
                 
-                frozen_closure = frozenset(epsilon_closure)
-                
-                if frozen_closure not in state_map:
-                    new_state = dfa.create_state(epsilon_closure)
-                    state_map[frozen_closure] = new_state
-                    unprocessed.append(new_state)
-                
-                current.transitions[symbol] = state_map[frozen_closure]
+                for block, members in touched.items():
+                    if len(members) == len(blocks[block]):
+                        continue
+                    new_block = len(blocks)
+                    blocks[block] -= members
+                    blocks.append(members)
+                    for member in members:
+                        block_of[member] = new_block
+                    if block in in_pending:
+                        pending.append(new_block)
+                        in_pending.add(new_block)
+                    else:
+                        smaller = new_block if len(members) <= len(blocks[block]) else block
+                        pending.append(smaller)
+                        in_pending.add(smaller)
+        
+        return self._rebuild(dfa, states, blocks, block_of, sink)
+    
+    def _live_states(self, dfa):
+        # Estados desde los que se puede llegar a uno de aceptación
+        predecessors = defaultdict(list)
+        for state in dfa.states:
+            for dest in state.transitions.values():
+                predecessors[dest.id].append(state.id)
+        
+        live = set(state.id for state in dfa.accept_states)
+        stack = list(live)
+        while stack:
+            for source in predecessors[stack.pop()]:
+                if source not in live:
+                    live.add(source)
+                    stack.append(source)
+        return live
+    
+    def _rebuild(self, dfa, states, blocks, block_of, sink):
+        index = {state.id: i for i, state in enumerate(states)}
+        minimized = DFA()
+        new_states = {}
+        
+        # Numeración en anchura desde el estado inicial
+        queue = deque([block_of[index[dfa.start_state.id]]])
+        order = []
+        while queue:
+            block = queue.popleft()
+            if block in new_states:
+                continue
+            representative = states[min(blocks[block])]
+            nfa_states = 0
+            for member in blocks[block]:
+                if member != sink:
+                    nfa_states |= states[member].nfa_states or 0
+            new_states[block] = minimized.create_state(
+                nfa_states, representative if representative.is_accepting else None)
+            order.append((block, representative))
+            for dest in representative.transitions.values():
+                if dest.id in index and block_of[index[dest.id]] != block_of[sink]:
+                    queue.append(block_of[index[dest.id]])
+        
+        for block, representative in order:
+            labels = defaultdict(list)
+            for symbol, dest in representative.transitions.items():
+                if dest.id in index and block_of[index[dest.id]] != block_of[sink]:
+                    labels[block_of[index[dest.id]]].extend(symbol.ranges)
+            for dest_block, ranges in labels.items():
+                new_states[block].transitions[CharSet(ranges)] = new_states[dest_block]
+        
+        minimized.start_state = new_states[block_of[index[dfa.start_state.id]]]
+        return minimized
+
+class EndMarker:
+    # Posición '#' que cierra una regla en la construcción directa
+    def __init__(self, position, token_action=None, priority=None):
+        self.position = position
+        self.token_action = token_action
+        self.priority = priority
+
+class DirectDFABuilder:
+    # Construcción directa regex -> DFA (nullable/firstpos/lastpos/followpos)
+    # sobre los RegexNode de varias reglas, cada una cerrada con su propio
+    # marcador de fin; no se materializa ningún NFA
+    def __init__(self, max_states=None, max_transitions=None):
+        self.max_states = max_states
+        self.max_transitions = max_transitions
+        self.position_sets = []
+        self.followpos = []
+        self.end_markers = {}
+    
+    def _new_position(self, charset):
+        self.position_sets.append(charset)
+        self.followpos.append(0)
+        return len(self.position_sets) - 1
+    
+    def _add_follow(self, last, first):
+        while last:
+            low = last & -last
+            self.followpos[low.bit_length() - 1] |= first
+            last ^= low
+    
+    def _analyze(self, root):
+        # Recorrido en postorden con pila explícita; devuelve
+        # (nullable, firstpos, lastpos) como bitmasks de posiciones.
+        # Los nodos no se modifican, así que un subárbol compartido
+        # recibe posiciones nuevas en cada aparición.
+        results = []
+        stack = [(root, False)]
+        
+        while stack:
+            node, expanded = stack.pop()
+            
+            if not expanded and node.type in ('CONCAT', 'UNION', 'STAR', 'PLUS', 'OPTIONAL'):
+                stack.append((node, True))
+                if node.type in ('CONCAT', 'UNION'):
+                    stack.append((node.right, False))
+                stack.append((node.left, False))
+                continue
+            
+            if node.type == 'CHAR' and node.value != 'ε':
+                position = 1 << self._new_position(CharSet.from_chars(node.value))
+                results.append((False, position, position))
+            elif node.type == 'CHARCLASS':
+                position = 1 << self._new_position(node.value)
+                results.append((False, position, position))
+            elif node.type == 'CONCAT':
+                right_nullable, right_first, right_last = results.pop()
+                left_nullable, left_first, left_last = results.pop()
+                self._add_follow(left_last, right_first)
+                results.append((
+                    left_nullable and right_nullable,
+                    left_first | right_first if left_nullable else left_first,
+                    left_last | right_last if right_nullable else right_last,
+                ))
+            elif node.type == 'UNION':
+                right_nullable, right_first, right_last = results.pop()
+                left_nullable, left_first, left_last = results.pop()
+                results.append((left_nullable or right_nullable, left_first | right_first, left_last | right_last))
+            elif node.type in ('STAR', 'PLUS'):
+                nullable, first, last = results.pop()
+                self._add_follow(last, first)
+                results.append((nullable or node.type == 'STAR', first, last))
+            elif node.type == 'OPTIONAL':
+                _, first, last = results.pop()
+                results.append((True, first, last))
+            else:
+                # ε y los nodos sin construcción (igual que NFABuilder)
+                results.append((True, 0, 0))
+        
+        return results.pop()
+    
+    def _accepting_marker(self, mask):
+        best = None
+        mask &= self.end_mask
+        while mask:
+            low = mask & -mask
+            marker = self.end_markers[low.bit_length() - 1]
+            mask ^= low
+            if best is None or marker.priority < best.priority:
+                best = marker
+        return best
+    
+    def build(self, rules):
+        # rules: lista de (RegexNode, acción, prioridad)
+        self.position_sets = []
+        self.followpos = []
+        self.end_markers = {}
+        self.end_mask = 0
+        
+        start = 0
+        for regex_tree, action, priority in rules:
+            nullable, first, last = self._analyze(regex_tree)
+            end = self._new_position(None)
+            self.end_markers[end] = EndMarker(end, action, priority)
+            self.end_mask |= 1 << end
+            self._add_follow(last, 1 << end)
+            start |= first | (1 << end if nullable else 0)
+        
+        dfa = DFA()
+        dfa.start_state = dfa.create_state(start, self._accepting_marker(start))
+        unprocessed = deque([dfa.start_state])
+        state_map = {start: dfa.start_state}
+        transition_count = 0
+        
+        while unprocessed:
+            current = unprocessed.popleft()
+            
+            edges = []
+            members = current.nfa_states & ~self.end_mask
+            while members:
+                low = members & -members
+                members ^= low
+                position = low.bit_length() - 1
+                edges.append((self.position_sets[position], self.followpos[position]))
+            
+            # Cada átomo lleva a la unión de followpos de sus posiciones
+            moves = CharSet.atoms(edges)
+            
+            for target, symbol in sorted(moves.items(), key=lambda move: move[1]):
+                if not target:
+                    continue
+                next_state = state_map.get(target)
+                if next_state is None:
+                    next_state = dfa.create_state(target, self._accepting_marker(target))
+                    state_map[target] = next_state
+                    unprocessed.append(next_state)
+                    if self.max_states is not None and len(dfa.states) > self.max_states:
+                        raise DFABudgetExceeded(f"more than {self.max_states} states")
+                current.transitions[symbol] = next_state
+                transition_count += 1
+                if self.max_transitions is not None and transition_count > self.max_transitions:
+                    raise DFABudgetExceeded(f"more than {self.max_transitions} transitions")
         
         return dfa
 
+class GlushkovBuilder(DirectDFABuilder):
+    # Autómata de posiciones (Glushkov) para reglas pequeñas: el lexer
+    # generado lo simula en paralelo de bits sobre un solo entero, sin
+    # determinizar. La posición 0 es el estado inicial y las posiciones de
+    # cada regla van después de las de reglas con más prioridad, así el bit
+    # aceptante más bajo identifica la regla ganadora.
+    max_positions = 60
+    pack_positions = 64
+    # Cada paquete cuesta un recorrido del texto por token, así que entran
+    # como mucho max_packs paquetes por modo. blowup() explora el DFA propio
+    # de una regla hasta probe_states estados; solo se usa si se pide un
+    # crecimiento mínimo (glushkov_min_blowup)
+    max_packs = 4
+    probe_states = 1024
+    
+    def positions(self, regex_tree):
+        self.position_sets = []
+        self.followpos = []
+        self._analyze(regex_tree)
+        return len(self.position_sets)
+    
+    def build(self, rules):
+        # rules: lista de (RegexNode, prioridad), en orden de prioridad
+        self.position_sets = []
+        self.followpos = []
+        self._new_position(None)
+        last_mask = 0
+        position_rules = [-1]
+        
+        for regex_tree, priority in rules:
+            _, first, last = self._analyze(regex_tree)
+            self.followpos[0] |= first
+            last_mask |= last
+            position_rules.extend([priority] * (len(self.position_sets) - len(position_rules)))
+        
+        return last_mask, position_rules
+    
+    def follow_chunks(self):
+        # Una tabla por byte de la máscara de estado: valor del byte -> unión
+        # de los followpos de sus posiciones, todas seguidas en una lista
+        chunks = []
+        for base in range(0, self.pack_positions, 8):
+            table = [0] * 256
+            for value in range(1, 256):
+                low = value & -value
+                position = base + low.bit_length() - 1
+                table[value] = table[value ^ low] | (self.followpos[position] if position < len(self.followpos) else 0)
+            chunks.extend(table)
+        return chunks
+    
+    def blowup(self, regex_tree, action):
+        # Estados del DFA propio de la regla por posición
+        size = self.positions(regex_tree)
+        try:
+            states = len(DirectDFABuilder(self.probe_states).build([(regex_tree, action, 0)]).states)
+        except DFABudgetExceeded:
+            states = self.probe_states
+        return states / max(size, 1)
+
 class RegexVisualizer:
-    def __init__(self):
+    def __init__(self, max_nodes=500):
         self.counter = 0
+        self.max_nodes = max_nodes
     
     def visualize(self, node, name="regex_tree"):
         dot = graphviz.Digraph(name)
@@ -610,60 +1726,147 @@ class RegexVisualizer:
         self._build_graph(dot, node)
         return dot
     
-    def _build_graph(self, dot, node):
-        if not node:
-            return None
-        
-        node_id = f"node_{self.counter}"
-        self.counter += 1
-        
-        if node.type in ('CHAR', 'RANGE', 'CHARCLASS'):
-            dot.node(node_id, f"{node.type}\\n{node.value}")
-        elif node.type in ('CONCAT', 'UNION', 'DIFF'):
-            dot.node(node_id, node.type)
-            left_id = self._build_graph(dot, node.left)
-            right_id = self._build_graph(dot, node.right)
-            if left_id:
-                dot.edge(node_id, left_id)
-            if right_id:
-                dot.edge(node_id, right_id)
-        else:
-            dot.node(node_id, node.type)
-            child_id = self._build_graph(dot, node.left)
-            if child_id:
-                dot.edge(node_id, child_id)
+    def _build_graph(self, dot, root):
+        # Preorden con pila explícita; los ids siguen el mismo orden que el
+        # recorrido recursivo (nodo, subárbol izquierdo, subárbol derecho)
+        stack = [(root, None)]
         
-        return node_id
+        while stack:
+            node, parent_id = stack.pop()
+            if not node:
+                continue
+            
+            node_id = f"node_{self.counter}"
+            self.counter += 1
+            
+            # Pasado el límite, cada subárbol pendiente queda como un nodo "…"
+            if self.counter > self.max_nodes:
+                dot.node(node_id, "…", shape="plaintext")
+            elif node.type in ('CHAR', 'RANGE', 'CHARCLASS'):
+                dot.node(node_id, f"{node.type}\\n{node.value}")
+            elif node.type in ('CONCAT', 'UNION', 'DIFF'):
+                dot.node(node_id, node.type)
+                stack.append((node.right, node_id))
+                stack.append((node.left, node_id))
+            else:
+                dot.node(node_id, node.type)
+                stack.append((node.left, node_id))
+            
+            if parent_id:
+                dot.edge(parent_id, node_id)
+
+class AutomatonVisualizer:
+    # Las aristas paralelas se fusionan en una sola con la unión de sus
+    # símbolos; pasado max_states solo se dibujan los estados más cercanos al
+    # inicial y un nodo que resume los demás
+    def __init__(self, max_states=200):
+        self.max_states = max_states
+    
+    def _visible(self, states, start, successors):
+        if len(states) <= self.max_states:
+            return list(states)
+        # Recorrido en anchura desde el inicial hasta max_states estados
+        shown = {start: None}
+        queue = deque([start])
+        while queue and len(shown) < self.max_states:
+            for dest in successors(queue.popleft()):
+                if dest not in shown and len(shown) < self.max_states:
+                    shown[dest] = None
+                    queue.append(dest)
+        return list(shown)
+    
+    @staticmethod
+    def _merge(merged, dest, symbol):
+        merged[dest] = merged[dest].union(symbol) if dest in merged else symbol
+    
+    @staticmethod
+    def _edge_label(symbols):
+        # La forma negada [^...] cuando es más corta que la clase misma
+        label = str(symbols)
+        complement = symbols.complement()
+        if complement.ranges and label != '_':
+            inner = str(complement)
+            negated = f"[^{inner[1:-1] if inner.startswith('[') else inner}]"
+            if len(negated) < len(label):
+                label = negated
+        return label.replace('\\', '\\\\').replace('"', '\\"')
+    
+    def _edges(self, dot, source, merged, visible):
+        # Las aristas hacia estados no dibujados van al nodo resumen
+        hidden = CharSet(())
+        for dest, symbols in merged.items():
+            if dest in visible:
+                dot.edge(source, str(dest.id), label=self._edge_label(symbols))
+            else:
+                hidden = hidden.union(symbols)
+        if hidden.ranges:
+            dot.edge(source, "more", label=self._edge_label(hidden), style="dashed")
+    
+    def _summary(self, dot, shown, total):
+        if shown < total:
+            dot.node("more", label=f"… {total - shown} more states", shape="box", style="dashed")
+            dot.attr(label=f"{shown} of {total} states")
 
-class NFAVisualizer:
+class NFAVisualizer(AutomatonVisualizer):
     def visualize(self, nfa, name="nfa"):
         dot = graphviz.Digraph(name)
         
-        for state in nfa.states:
+        # Cadenas ε: un estado que no acepta y cuya única salida es una ε se
+        # omite, y lo que llega a él va directo al final de la cadena
+        resolved = {}
+        
+        def resolve(state):
+            chain = []
+            while state not in resolved:
+                if (state is nfa.start_state or state.is_accepting or state.transitions
+                        or len(state.epsilon_transitions) != 1 or state in chain):
+                    resolved[state] = state
+                    break
+                chain.append(state)
+                state = next(iter(state.epsilon_transitions))
+            for member in chain:
+                resolved[member] = resolved[state]
+            return resolved[state]
+        
+        def successors(state):
+            for destinations in state.transitions.values():
+                yield from (resolve(dest) for dest in destinations)
+            yield from (resolve(dest) for dest in state.epsilon_transitions)
+        
+        kept = [state for state in nfa.states if resolve(state) is state]
+        shown = self._visible(kept, nfa.start_state, successors)
+        visible = set(shown)
+        
+        for state in shown:
             if state.is_accepting:
                 dot.node(str(state.id), shape="doublecircle")
             else:
                 dot.node(str(state.id), shape="circle")
             
+            merged = {}
             for symbol, destinations in state.transitions.items():
-                escaped = symbol.replace('\\', '\\\\').replace('"', '\\"')
                 for dest in destinations:
-                    dot.edge(str(state.id), str(dest.id), label=escaped)
+                    self._merge(merged, resolve(dest), symbol)
+            self._edges(dot, str(state.id), merged, visible)
             
-            for dest in state.epsilon_transitions:
-                dot.edge(str(state.id), str(dest.id), label="ε")
+            epsilons = {resolve(dest) for dest in state.epsilon_transitions} - {state}
+            for dest in sorted(epsilons, key=lambda dest: dest.id):
+                dot.edge(str(state.id), str(dest.id) if dest in visible else "more", label="ε")
         
+        self._summary(dot, len(shown), len(kept))
         if nfa.start_state:
             dot.node("start", shape="point")
             dot.edge("start", str(nfa.start_state.id))
         
         return dot
 
-class DFAVisualizer:
+class DFAVisualizer(AutomatonVisualizer):
     def visualize(self, dfa, name="dfa"):
         dot = graphviz.Digraph(name)
+        shown = self._visible(dfa.states, dfa.start_state, lambda state: state.transitions.values())
+        visible = set(shown)
         
-        for state in dfa.states:
+        for state in shown:
             label = f"{state.id}"
             if state.token_action:
                 label += f"\\n{state.token_action}"
@@ -673,19 +1876,234 @@ class DFAVisualizer:
             else:
                 dot.node(str(state.id), label=label, shape="circle")
             
+            merged = {}
             for symbol, dest in state.transitions.items():
-                escaped_symbol = symbol.replace('\\', '\\\\').replace('"', '\\"')
-                dot.edge(str(state.id), str(dest.id), label=escaped_symbol)
+                self._merge(merged, dest, symbol)
+            self._edges(dot, str(state.id), merged, visible)
         
+        self._summary(dot, len(shown), len(dfa.states))
         if dfa.start_state:
             dot.node("start", shape="point")
             dot.edge("start", str(dfa.start_state.id))
         
         return dot
 
+class BuildReport:
+    # Tiempo, memoria pico y conteos de cada fase de la generación, más los
+    # tamaños de cada regla. La memoria solo se mide con trace_memory, porque
+    # tracemalloc hace bastante más lenta la compilación; lo que ocurre en
+    # los procesos del pool no entra en la medición
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.rules = []
+    
+    @contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+        record = {'phase': name}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            if self.trace_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record['peak_bytes'] = peak - before
+                record['retained_bytes'] = current - before
+            self.phases.append(record)
+    
+    @staticmethod
+    def tree_nodes(root):
+        count = 0
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node:
+                count += 1
+                stack.append(node.left)
+                stack.append(node.right)
+        return count
+    
+    @staticmethod
+    def automaton_size(automaton):
+        # (estados, transiciones); en un NFA cuentan también las ε
+        transitions = 0
+        for state in automaton.states:
+            for destinations in state.transitions.values():
+                transitions += len(destinations) if isinstance(destinations, set) else 1
+            transitions += len(getattr(state, 'epsilon_transitions', ()))
+        return len(automaton.states), transitions
+    
+    def to_dict(self):
+        return {
+            'seconds': round(sum(record['seconds'] for record in self.phases), 6),
+            'phases': self.phases,
+            'rules': self.rules,
+        }
+    
+    def save(self, path):
+        text = json.dumps(self.to_dict(), indent=2, ensure_ascii=False)
+        if path == "-":
+            print(text)
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(text + "\n")
+
+class BuildCache:
+    # Caché direccionado por contenido: cada entrada guarda las tablas
+    # compiladas bajo el hash de la especificación normalizada, la versión
+    # del generador y las opciones que afectan a las tablas. Se desaloja la
+    # entrada usada hace más tiempo cuando el directorio pasa de max_bytes.
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+    
+    @staticmethod
+    def key(yalex_data, options):
+        # Solo lo que llega a las tablas: header y trailer se escriben tal
+        # cual en cada generación y los comentarios ya no están
+        normalized = {
+            'version': GENERATOR_VERSION,
+            'definitions': sorted(yalex_data['definitions'].items()),
+            'keywords': sorted(yalex_data['keywords'].items()),
+            'entrypoints': yalex_data['entrypoints'],
+            'rules': yalex_data['rules'],
+            'options': sorted(options.items()),
+        }
+        text = json.dumps(normalized, ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+    
+    def load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                tables = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Entrada corrupta o de otra versión de Python: se descarta
+            self._remove(path)
+            return None
+        
+        # La fecha de modificación sirve de marca de uso para el desalojo
+        os.utime(path)
+        return tables
+    
+    def store(self, key, tables):
+        os.makedirs(self.directory, exist_ok=True)
+        # Escritura atómica: otro proceso nunca ve una entrada a medias
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(tables, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            self._remove(temp_path)
+            raise
+        self.evict()
+    
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pickle") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+    
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _parse_rules_job(task):
+    # Trabajo de un proceso del pool: parsea un bloque de reglas y, con el
+    # motor thompson, construye también sus NFAs en forma compacta
+    definitions, simplify, thompson, rules = task
+    regex_parser = RegexParser(definitions)
+    simplifier = RegexSimplifier()
+    nfa_builder = NFABuilder()
+    results = []
+    for regexp, action in rules:
+        start = time.perf_counter()
+        try:
+            regex_tree = regex_parser.parse(regexp)
+            if simplify:
+                regex_tree = simplifier.simplify(regex_tree)
+        except Exception as e:
+            print(f"Error parsing rule: '{regexp}'. Action: {action}. Error: {e}")
+            raise e
+        seconds = time.perf_counter() - start
+        nfa = nfa_builder.build_from_regex(regex_tree).to_compact() if thompson else None
+        results.append((regex_tree, nfa, seconds))
+    return results
+
+def _convert_rules_job(task):
+    # Trabajo de un proceso del pool: determiniza un grupo de reglas y
+    # devuelve el DFA compacto, o la excepción si excede el presupuesto
+    engine, eliminate_epsilons, max_states, max_transitions, rules = task
+    try:
+        if engine == "direct":
+            dfa = DirectDFABuilder(max_states, max_transitions).build(rules)
+        else:
+            nfa = NFA().combine([LexerGenerator._accept_rule(NFA.from_compact(compact), i, action)
+                                 for i, action, compact in rules])
+            if eliminate_epsilons:
+                nfa = nfa.remove_epsilons()
+            dfa = NFAToDFAConverter(max_states, max_transitions).convert(nfa)
+    except DFABudgetExceeded as e:
+        return e
+    return dfa.to_compact()
+
+def _minimize_job(compact):
+    return DFAMinimizer().minimize(DFA.from_compact(compact)).to_compact()
+
 class LexerGenerator:
-    def __init__(self, yalex_file):
+    def __init__(self, yalex_file, eliminate_epsilons=False, engine="thompson", minimize=True, simplify=True,
+                 backend="table", lazy_cache_size=4096, max_dfa_states=None, max_dfa_transitions=None,
+                 cache=None, jobs=1, profile=False, glushkov_min_blowup=None):
+        if engine not in ("thompson", "direct"):
+            raise ValueError(f"Unknown engine: {engine}")
+        if backend not in ("table", "lazy", "glushkov"):
+            raise ValueError(f"Unknown backend: {backend}")
+        if backend == "lazy" and engine != "thompson":
+            raise ValueError("The lazy backend needs the NFAs of the thompson engine")
+        if jobs < 1:
+            raise ValueError(f"Invalid number of jobs: {jobs}")
         self.yalex_file = yalex_file
+        self.eliminate_epsilons = eliminate_epsilons
+        self.engine = engine
+        self.minimize = minimize
+        self.simplify = simplify
+        self.backend = backend
+        self.lazy_cache_size = lazy_cache_size
+        self.max_dfa_states = max_dfa_states
+        self.max_dfa_transitions = max_dfa_transitions
+        self.glushkov_min_blowup = glushkov_min_blowup
+        self.cache = cache
+        self.jobs = jobs
+        self.pool = None
+        self.report = BuildReport(trace_memory=profile)
+        self.fallback_rules = set()
+        self.glushkov_rules = set()
+        self.rule_entries = []
         self.yalex_data = None
         self.regex_trees = []
         self.nfas = []
@@ -704,87 +2122,859 @@ class LexerGenerator:
             raise ValueError("YALex file not parsed yet")
 
         regex_parser = RegexParser(self.yalex_data['definitions'])
+        simplifier = RegexSimplifier()
         self.regex_trees = []
+        self.rule_entries = []
+        reused = 0
+        cached_rules = {}
+        if self.cache is not None:
+            cached_rules = self.cache.load(self._rule_cache_key()) or {}
 
+        # Con caché, cada regla reutiliza su árbol (y su NFA) mientras no
+        # cambien su texto ni las definiciones de las que depende
+        pending = []
         for regexp, action in self.yalex_data['rules']:
+            key = self._rule_key(regex_parser, regexp) if self.cache is not None else None
+            if key in cached_rules:
+                entry = dict(cached_rules[key], key=key, dirty=False, seconds=None)
+                reused += 1
+            else:
+                entry = {'key': key, 'tree': None, 'nfa': None, 'dirty': True, 'seconds': None}
+                pending.append((entry, regexp, action))
+            self.rule_entries.append(entry)
+
+        if self.pool is not None and len(pending) > 1:
+            self._parse_in_pool(pending)
+        for entry, regexp, action in pending:
+            if entry['tree'] is not None:
+                continue
+            start = time.perf_counter()
             try:
                 regex_tree = regex_parser.parse(regexp)
-                self.regex_trees.append((regex_tree, action))
+                if self.simplify:
+                    regex_tree = simplifier.simplify(regex_tree)
+                entry['tree'] = regex_tree
+                entry['seconds'] = time.perf_counter() - start
                 print(f"Successfully parsed rule: '{regexp}' -> {action}")
             except Exception as e:
                 print(f"Error parsing rule: '{regexp}'. Action: {action}. Error: {e}")
                 raise e
 
+        self.regex_trees = [(entry['tree'], action)
+                            for entry, (_, action) in zip(self.rule_entries, self.yalex_data['rules'])]
+        self.report.rules = [{
+            'rule': regexp,
+            'action': action,
+            'cached': entry['seconds'] is None,
+            'parse_seconds': None if entry['seconds'] is None else round(entry['seconds'], 6),
+            'tree_nodes': BuildReport.tree_nodes(entry['tree']),
+        } for entry, (regexp, action) in zip(self.rule_entries, self.yalex_data['rules'])]
+        if reused:
+            print(f"Reused {reused} cached rules")
         return self.regex_trees
 
+    def _parse_in_pool(self, pending):
+        # Bloques de reglas repartidos entre los procesos del pool; con el
+        # motor thompson vuelven también sus NFAs en forma compacta
+        thompson = self.engine == "thompson"
+        size = -(-len(pending) // (self.jobs * 4))
+        tasks = [(self.yalex_data['definitions'], self.simplify, thompson,
+                  [(regexp, action) for _, regexp, action in pending[k:k + size]])
+                 for k in range(0, len(pending), size)]
+        results = [result for chunk in self.pool.map(_parse_rules_job, tasks) for result in chunk]
+        for (entry, regexp, action), (regex_tree, nfa, seconds) in zip(pending, results):
+            entry['tree'] = regex_tree
+            entry['nfa'] = nfa
+            entry['seconds'] = seconds
+            print(f"Successfully parsed rule: '{regexp}' -> {action}")
+
+    def _rule_key(self, regex_parser, regexp):
+        # Una regla depende de su texto y del de todas las definiciones que
+        # alcanza; cambiar cualquier otra definición no la invalida
+        definitions = self.yalex_data['definitions']
+        dependencies = sorted((name, definitions[name]) for name in regex_parser.dependencies(regexp))
+        text = json.dumps([GENERATOR_VERSION, self.simplify, regexp, dependencies], ensure_ascii=False)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def _rule_cache_key(self):
+        # Las reglas de cada archivo se guardan juntas en una sola entrada:
+        # una lectura y una escritura por compilación en vez de una por regla
+        path = os.path.abspath(self.yalex_file)
+        return "rules-" + hashlib.sha256(path.encode('utf-8')).hexdigest()
+
+    def store_rule_cache(self):
+        # Se reescribe solo si alguna regla es nueva o cambió; las reglas que
+        # ya no están en el archivo desaparecen de la entrada
+        if not any(entry['dirty'] for entry in self.rule_entries):
+            return
+        cached_rules = {entry['key']: {'tree': entry['tree'], 'nfa': entry['nfa']}
+                        for entry in self.rule_entries}
+        self.cache.store(self._rule_cache_key(), cached_rules)
+        for entry in self.rule_entries:
+            entry['dirty'] = False
+
     def build_nfas(self):
         if not self.regex_trees:
             raise ValueError("Regex trees not built yet")
 
         self.nfas = []
-        for regex_tree, action in self.regex_trees:
-            nfa = self.nfa_builder.build_from_regex(regex_tree)
-            for state in nfa.accept_states:
-                state.token_action = action
-                state.is_accepting = True
+        for i, (regex_tree, action) in enumerate(self.regex_trees):
+            entry = self.rule_entries[i]
+            if entry['nfa'] is not None:
+                nfa = self._accept_rule(NFA.from_compact(entry['nfa']), i, action)
+            else:
+                nfa = self._build_rule_nfa(i, regex_tree, action)
+                # La forma compacta sirve a la caché y a los procesos del pool
+                if self.cache is not None or self.pool is not None:
+                    entry['nfa'] = nfa.to_compact()
+                    entry['dirty'] = True
+            record = self.report.rules[i]
+            record['nfa_states'], record['nfa_transitions'] = BuildReport.automaton_size(nfa)
             self.nfas.append(nfa)
         return self.nfas
 
+    def _build_rule_nfa(self, priority, regex_tree, action):
+        return self._accept_rule(self.nfa_builder.build_from_regex(regex_tree), priority, action)
+
+    @staticmethod
+    def _accept_rule(nfa, priority, action):
+        for state in nfa.accept_states:
+            state.token_action = action
+            state.priority = priority
+            state.is_accepting = True
+        return nfa
+
+    def select_glushkov_rules(self):
+        if not self.regex_trees:
+            raise ValueError("Regex trees not built yet")
+
+        # Las reglas con pocas posiciones se simulan en paralelo de bits, en
+        # orden de prioridad mientras quepan en max_packs paquetes por modo;
+        # la decisión solo cuenta posiciones, sin determinizar nada. Con
+        # glushkov_min_blowup solo entran las reglas cuyo DFA propio crece
+        # al menos tanto por posición, primero las que más crecen
+        builder = GlushkovBuilder()
+        self.glushkov_rules = set()
+        for _, _, start, end in self.yalex_data['entrypoints']:
+            candidates = []
+            sizes = {}
+            for i in range(start, end):
+                regex_tree, action = self.regex_trees[i]
+                sizes[i] = builder.positions(regex_tree)
+                if sizes[i] > builder.max_positions:
+                    continue
+                if self.glushkov_min_blowup is None:
+                    candidates.append((0, i))
+                    continue
+                blowup = builder.blowup(regex_tree, action)
+                if blowup >= self.glushkov_min_blowup:
+                    candidates.append((-blowup, i))
+            selected = set()
+            for _, i in sorted(candidates):
+                if len(self._glushkov_packs(selected | {i}, sizes)) <= builder.max_packs:
+                    selected.add(i)
+            self.glushkov_rules |= selected
+        return self.glushkov_rules
+
+    def _glushkov_packs(self, rules, sizes):
+        # Paquetes en orden de prioridad con hasta pack_positions - 1
+        # posiciones cada uno (la 0 es el estado inicial); sizes[i] son las
+        # posiciones de la regla i
+        packs = []
+        for i in sorted(rules):
+            size = sizes[i]
+            if not packs or packs[-1][0] + size > GlushkovBuilder.pack_positions - 1:
+                packs.append([0, []])
+            packs[-1][0] += size
+            packs[-1][1].append((self.regex_trees[i][0], i))
+        return [rules for _, rules in packs]
+
     def build_dfas(self):
+        if self.engine == "direct":
+            return self.build_direct_dfas()
         if not self.nfas:
             raise ValueError("NFAs not built yet")
 
-        converter = NFAToDFAConverter()
-        self.dfas = []
+        converter = NFAToDFAConverter(self.max_dfa_states, self.max_dfa_transitions)
 
-        for nfa in self.nfas:
-            dfa = converter.convert(nfa)
-            for state in dfa.accept_states:
-                for nfa_state in state.nfa_states:
-                    if nfa_state.is_accepting and nfa_state.token_action:
-                        state.token_action = nfa_state.token_action
-                        break
-            self.dfas.append(dfa)
+        def convert(rules):
+            nfa = NFA().combine([self.nfas[i] for i in rules])
+            if self.eliminate_epsilons:
+                nfa = nfa.remove_epsilons()
+            return converter.convert(nfa)
+
+        def task(rules):
+            return ("thompson", self.eliminate_epsilons, self.max_dfa_states, self.max_dfa_transitions,
+                    [(i, self.regex_trees[i][1], self.rule_entries[i]['nfa']) for i in rules])
+
+        self.dfas = self._convert_modes(convert, task)
         return self.dfas
+
+    def _convert_modes(self, convert, task):
+        # Un DFA por modo (entrypoint) con todas sus reglas combinadas; las
+        # reglas del matcher Glushkov no entran al DFA
+        modes = [(entrypoint, [i for i in range(start, end) if i not in self.glushkov_rules])
+                 for entrypoint, _, start, end in self.yalex_data['entrypoints']]
+        self.fallback_rules = set()
+
+        if self.max_dfa_states is not None or self.max_dfa_transitions is not None:
+            # Cada regla se prueba sola; las que ya exceden el presupuesto se
+            # simulan como NFA en el lexer generado y no entran al DFA del modo
+            rules = [i for _, mode_rules in modes for i in mode_rules]
+            for i, result in zip(rules, self._convert_groups(convert, task, [[i] for i in rules])):
+                if isinstance(result, DFABudgetExceeded):
+                    regexp, action = self.yalex_data['rules'][i]
+                    print(f"Warning: rule '{regexp}' -> {action} exceeded the DFA budget ({result}); "
+                          f"using NFA simulation for it")
+                    self.fallback_rules.add(i)
+            modes = [(entrypoint, [i for i in mode_rules if i not in self.fallback_rules])
+                     for entrypoint, mode_rules in modes]
+
+        dfas = []
+        for (entrypoint, rules), result in zip(modes, self._convert_groups(convert, task, [r for _, r in modes])):
+            if isinstance(result, DFABudgetExceeded):
+                print(f"Warning: the rules of mode '{entrypoint}' together exceeded the DFA budget ({result}); "
+                      f"using NFA simulation for all of them")
+                self.fallback_rules.update(rules)
+                result = convert([])
+            dfas.append(result)
+        return dfas
+
+    def _convert_groups(self, convert, task, groups):
+        # Determiniza cada grupo de reglas por separado, en los procesos del
+        # pool si lo hay; un grupo que excede el presupuesto da la excepción
+        if self.pool is None:
+            results = []
+            for rules in groups:
+                try:
+                    results.append(convert(rules))
+                except DFABudgetExceeded as e:
+                    results.append(e)
+            return results
+
+        # Con menos grupos que procesos (un solo modo, por ejemplo) cada grupo
+        # se parte en bloques de reglas consecutivas que se determinizan en el
+        # pool; sus DFAs se unen después aquí. Si un bloque excede el
+        # presupuesto, el grupo completo también lo excede, y se determiniza
+        # aquí solo para reportar el mismo límite que sin pool
+        parts = max(1, self.jobs // max(len(groups), 1))
+        blocks = []
+        for group, rules in enumerate(groups):
+            step = max(1, -(-len(rules) // parts))
+            for start in range(0, max(len(rules), 1), step):
+                blocks.append((group, rules[start:start + step]))
+
+        size = max(1, len(blocks) // (self.jobs * 4))
+        partial = [[] for _ in groups]
+        for (group, _), result in zip(blocks, self.pool.map(_convert_rules_job, [task(rules) for _, rules in blocks],
+                                                              chunksize=size)):
+            partial[group].append(result if isinstance(result, DFABudgetExceeded) else DFA.from_compact(result))
+
+        converter = NFAToDFAConverter(self.max_dfa_states, self.max_dfa_transitions)
+        results = []
+        for rules, dfas in zip(groups, partial):
+            if len(dfas) == 1 and not isinstance(dfas[0], DFABudgetExceeded):
+                results.append(dfas[0])
+                continue
+            try:
+                if any(isinstance(dfa, DFABudgetExceeded) for dfa in dfas):
+                    results.append(convert(rules))
+                else:
+                    results.append(converter.merge(dfas))
+            except DFABudgetExceeded as e:
+                results.append(e)
+        return results
     
-    def visualize_regex_trees(self, output_dir="output"):
-        os.makedirs(output_dir, exist_ok=True)
+    def minimize_dfas(self):
+        if not self.dfas:
+            raise ValueError("DFAs not built yet")
+
+        # Un DFA por proceso; Hopcroft sobre un solo DFA es secuencial, así
+        # que con un solo modo la minimización no aprovecha el pool
+        if self.pool is not None and len(self.dfas) > 1:
+            compacts = self.pool.map(_minimize_job, [dfa.to_compact() for dfa in self.dfas])
+            self.dfas = [DFA.from_compact(compact) for compact in compacts]
+            return self.dfas
+
+        minimizer = DFAMinimizer()
+        self.dfas = [minimizer.minimize(dfa) for dfa in self.dfas]
+        return self.dfas
+
+    def build_direct_dfas(self):
+        if not self.regex_trees:
+            raise ValueError("Regex trees not built yet")
+
+        builder = DirectDFABuilder(self.max_dfa_states, self.max_dfa_transitions)
+
+        def convert(rules):
+            return builder.build([(self.regex_trees[i][0], self.regex_trees[i][1], i) for i in rules])
+
+        def task(rules):
+            return ("direct", self.eliminate_epsilons, self.max_dfa_states, self.max_dfa_transitions,
+                    [(self.regex_trees[i][0], self.regex_trees[i][1], i) for i in rules])
+
+        self.dfas = self._convert_modes(convert, task)
+        return self.dfas
+
+    def _mode_names(self):
+        return [entrypoint for entrypoint, _, _, _ in self.yalex_data['entrypoints']]
+
+    def _action_value(self, action):
+        # Extract just the return value without 'return '
+        # { comment } solo cambia de modo y no produce token
+        parts = [part.strip() for part in action.split(';')]
+        for part in parts:
+            if part.startswith('return'):
+                return part[len('return'):].strip()
+        if any(part in self._mode_names() for part in parts):
+            return None
+        return action
+
+    def _action_mode(self, action):
+        # { return STRING; string } cambia al modo 'string' tras el token
+        modes = self._mode_names()
+        for part in action.split(';'):
+            if part.strip() in modes:
+                return modes.index(part.strip())
+        return None
+
+    def build_keyword_tables(self):
+        if not self.yalex_data:
+            raise ValueError("YALex file not parsed yet")
+
+        tokens = {self._action_value(action) for _, action in self.yalex_data['rules']}
+        tables = {}
+
+        for token, words in self.yalex_data.get('keywords', {}).items():
+            if token not in tokens:
+                print(f"Warning: keywords declared for '{token}', but no rule returns it")
+            table = tables.setdefault(token, {})
+            for word, action in words:
+                if word in table:
+                    print(f"Warning: duplicate keyword '{word}' for '{token}'")
+                table[word] = self._action_value(action)
+
+        return tables
+    
+    def visualize_regex_trees(self, output_dir="output", format="png"):
         visualizer = RegexVisualizer()
-        
-        for i, (regex_tree, _) in enumerate(self.regex_trees):
-            dot = visualizer.visualize(regex_tree, f"regex_tree_{i}")
-            dot.render(f"{output_dir}/regex_tree_{i}", format="png", cleanup=True)
+        graphs = [(f"regex_tree_{i}", visualizer.visualize(regex_tree, f"regex_tree_{i}"))
+                  for i, (regex_tree, _) in enumerate(self.regex_trees)]
+        return self._render(graphs, output_dir, format)
     
-    def visualize_nfas(self, output_dir="output"):
-        os.makedirs(output_dir, exist_ok=True)
-        visualizer = NFAVisualizer()
-        
-        for i, nfa in enumerate(self.nfas):
-            dot = visualizer.visualize(nfa, f"nfa_{i}")
-            dot.render(f"{output_dir}/nfa_{i}", format="png", cleanup=True)
+    def visualize_nfas(self, output_dir="output", format="png", max_states=200):
+        visualizer = NFAVisualizer(max_states)
+        graphs = [(f"nfa_{i}", visualizer.visualize(nfa, f"nfa_{i}")) for i, nfa in enumerate(self.nfas)]
+        return self._render(graphs, output_dir, format)
     
-    def visualize_dfas(self, output_dir="output"):
+    def visualize_dfas(self, output_dir="output", format="png", max_states=200):
+        visualizer = DFAVisualizer(max_states)
+        graphs = [(f"dfa_{i}", visualizer.visualize(dfa, f"dfa_{i}")) for i, dfa in enumerate(self.dfas)]
+        return self._render(graphs, output_dir, format)
+    
+    def render_automata(self, output_dir="output", format="png", max_states=200):
+        # Con las tablas en caché los autómatas no se construyeron en esta
+        # ejecución; se compilan solo para dibujarlos
+        if not self.regex_trees:
+            self.compile_tables()
+        with self.report.phase("render") as record:
+            rendered = self.visualize_regex_trees(output_dir, format)
+            rendered += self.visualize_nfas(output_dir, format, max_states)
+            rendered += self.visualize_dfas(output_dir, format, max_states)
+            record['graphs'] = rendered
+        print(f"Rendered {rendered} graphs in {output_dir}")
+        return rendered
+    
+    def _render(self, graphs, output_dir, format):
+        # Solo se dibujan los grafos cuyo DOT cambió desde la última vez.
+        # Graphviz corre como proceso aparte, así que los hilos del pool
+        # solapan esas llamadas; "dot" guarda el fuente sin invocarlo
+        if format not in ("png", "svg", "dot"):
+            raise ValueError(f"Unknown render format: {format}")
         os.makedirs(output_dir, exist_ok=True)
-        visualizer = DFAVisualizer()
+        index_path = os.path.join(output_dir, ".render-hashes.json")
+        try:
+            with open(index_path, 'r', encoding='utf-8') as file:
+                hashes = json.load(file)
+        except (OSError, ValueError):
+            hashes = {}
+        
+        pending = []
+        for name, dot in graphs:
+            path = os.path.join(output_dir, name)
+            digest = hashlib.sha256(dot.source.encode('utf-8')).hexdigest()
+            if hashes.get(f"{name}.{format}") != digest or not os.path.exists(f"{path}.{format}"):
+                pending.append((name, dot, path, digest))
         
-        for i, dfa in enumerate(self.dfas):
-            dot = visualizer.visualize(dfa, f"dfa_{i}")
-            dot.render(f"{output_dir}/dfa_{i}", format="png", cleanup=True)
+        def render(item):
+            name, dot, path, digest = item
+            if format == "dot":
+                dot.save(f"{path}.dot")
+            else:
+                dot.render(path, format=format, cleanup=True)
+            return name, digest
+        
+        try:
+            with ThreadPoolExecutor() as pool:
+                for name, digest in pool.map(render, pending):
+                    hashes[f"{name}.{format}"] = digest
+        finally:
+            with open(index_path, 'w', encoding='utf-8') as file:
+                json.dump(hashes, file, indent=1, sort_keys=True)
+        return len(pending)
     
+    def _character_classes(self, rows):
+        # Parte el espacio de code points en intervalos elementales y junta
+        # los que se comportan igual en todos los estados (clases de
+        # equivalencia), de modo que la tabla crece con los rangos usados y
+        # no con la cantidad de caracteres
+        points = {0}
+        for row in rows:
+            for charset, _ in row:
+                for lo, hi in charset.ranges:
+                    points.add(lo)
+                    points.add(hi + 1)
+        bounds = sorted(points)
+
+        signatures = [[] for _ in bounds]
+        for state_id, row in enumerate(rows):
+            for charset, dest in row:
+                for lo, hi in charset.ranges:
+                    for k in range(bisect_left(bounds, lo), bisect_left(bounds, hi + 1)):
+                        signatures[k].append((state_id, dest))
+
+        class_ids = {}
+        interval_classes = []
+        for signature in signatures:
+            interval_classes.append(class_ids.setdefault(tuple(signature), len(class_ids)))
+
+        # Intervalos vecinos de la misma clase se fusionan
+        class_bounds = []
+        merged_classes = []
+        for bound, class_id in zip(bounds, interval_classes):
+            if not merged_classes or merged_classes[-1] != class_id:
+                class_bounds.append(bound)
+                merged_classes.append(class_id)
+
+        # class_members[c] = pares (estado, destino) con transición en c
+        return class_bounds, merged_classes, list(class_ids)
+
+    def build_tables(self):
+        if not self.dfas:
+            raise ValueError("DFAs not built yet")
+
+        # Todos los modos comparten una sola tabla; cada modo solo aporta
+        # su estado inicial, así que cambiar de modo es asignar un entero
+        offsets = []
+        total = 0
+        for dfa in self.dfas:
+            offsets.append(total)
+            total += len(dfa.states)
+
+        rows = []
+        accepts = []
+        for offset, dfa in zip(offsets, self.dfas):
+            for state in dfa.states:
+                rows.append([(symbol, offset + dest.id) for symbol, dest in state.transitions.items()])
+                accepts.append(state.priority if state.is_accepting and state.priority is not None else -1)
+
+        # Las reglas que excedieron el presupuesto del DFA se simulan como un
+        # NFA sin ε por modo; sus filas comparten las clases de caracteres
+        vm_nfas = []
+        for _, _, start, end in self.yalex_data['entrypoints']:
+            rules = [i for i in range(start, end) if i in self.fallback_rules]
+            vm_nfas.append(NFA().combine([self._fallback_nfa(i) for i in rules]).remove_epsilons() if rules else None)
+
+        vm_offsets = []
+        vm_total = 0
+        vm_accepts = []
+        for nfa in vm_nfas:
+            vm_offsets.append(vm_total)
+            if nfa is None:
+                continue
+            vm_total += len(nfa.states)
+            for state in nfa.states:
+                rows.append([(symbol, vm_offsets[-1] + dest.id) for symbol, destinations in state.transitions.items()
+                             for dest in destinations])
+                vm_accepts.append(state.priority if state.is_accepting and state.priority is not None else -1)
+
+        # Reglas pequeñas: paquetes de autómatas Glushkov de hasta
+        # pack_positions posiciones; cada paquete aporta una fila con sus
+        # posiciones para que también compartan las clases de caracteres
+        builder = GlushkovBuilder()
+        glushkov = []
+        mode_glushkov = []
+        for _, _, start, end in self.yalex_data['entrypoints']:
+            mode_glushkov.append([])
+            rules = [i for i in range(start, end) if i in self.glushkov_rules]
+            sizes = {i: builder.positions(self.regex_trees[i][0]) for i in rules}
+            for rules in self._glushkov_packs(rules, sizes):
+                last_mask, position_rules = builder.build(rules)
+                mode_glushkov[-1].append(len(glushkov))
+                glushkov.append((builder.follow_chunks(), last_mask, position_rules))
+                rows.append([(charset, position) for position, charset in enumerate(builder.position_sets)
+                             if charset is not None])
+
+        class_bounds, interval_classes, class_members = self._character_classes(rows)
+        num_classes = len(class_members)
+        transitions = [-1] * (len(accepts) * num_classes)
+        char_masks = [[0] * num_classes for _ in glushkov]
+        for class_id, members in enumerate(class_members):
+            for state_id, dest in members:
+                if state_id < len(accepts):
+                    transitions[state_id * num_classes + class_id] = dest
+                elif state_id >= len(accepts) + len(vm_accepts):
+                    char_masks[state_id - len(accepts) - len(vm_accepts)][class_id] |= 1 << dest
+        move_offsets, move_classes, move_targets = self._successor_lists(len(vm_accepts), class_members, len(accepts))
+
+        return {
+            'backend': 'table',
+            'modes': self._mode_names(),
+            'mode_starts': [offset + dfa.start_state.id for offset, dfa in zip(offsets, self.dfas)],
+            'class_bounds': class_bounds,
+            'interval_classes': interval_classes,
+            'num_classes': num_classes,
+            'transitions': transitions,
+            'accepts': accepts,
+            'vm_starts': [offset + nfa.start_state.id if nfa is not None else -1
+                          for offset, nfa in zip(vm_offsets, vm_nfas)],
+            'vm_offsets': move_offsets,
+            'vm_classes': move_classes,
+            'vm_targets': move_targets,
+            'vm_accepts': vm_accepts,
+            'glushkov': [(chunks, masks, last_mask, position_rules) for (chunks, last_mask, position_rules), masks
+                         in zip(glushkov, char_masks)],
+            'mode_glushkov': mode_glushkov,
+            'actions': [self._action_value(action) for _, action in self.yalex_data['rules']],
+            'action_modes': [self._action_mode(action) for _, action in self.yalex_data['rules']],
+            'keywords': self.build_keyword_tables(),
+        }
+
+    def _fallback_nfa(self, rule):
+        # Con el motor directo no hay NFAs construidos de antemano
+        if self.nfas:
+            return self.nfas[rule]
+        regex_tree, action = self.regex_trees[rule]
+        return self._build_rule_nfa(rule, regex_tree, action)
+
+    def build_lazy_tables(self):
+        if not self.nfas:
+            raise ValueError("NFAs not built yet")
+
+        # El lexer generado conserva un NFA sin transiciones ε por modo y lo
+        # determiniza bajo demanda; aquí no se hace construcción de subconjuntos
+        nfas = []
+        for _, _, start, end in self.yalex_data['entrypoints']:
+            nfas.append(NFA().combine(self.nfas[start:end]).remove_epsilons())
+
+        offsets = []
+        total = 0
+        for nfa in nfas:
+            offsets.append(total)
+            total += len(nfa.states)
+
+        rows = []
+        accepts = []
+        for offset, nfa in zip(offsets, nfas):
+            for state in nfa.states:
+                rows.append([(symbol, offset + dest.id) for symbol, destinations in state.transitions.items()
+                             for dest in destinations])
+                accepts.append(state.priority if state.is_accepting and state.priority is not None else -1)
+
+        class_bounds, interval_classes, class_members = self._character_classes(rows)
+        move_offsets, move_classes, move_targets = self._successor_lists(len(rows), class_members)
+
+        return {
+            'backend': 'lazy',
+            'modes': self._mode_names(),
+            'mode_starts': [offset + nfa.start_state.id for offset, nfa in zip(offsets, nfas)],
+            'class_bounds': class_bounds,
+            'interval_classes': interval_classes,
+            'num_classes': len(class_members),
+            'nfa_offsets': move_offsets,
+            'nfa_classes': move_classes,
+            'nfa_targets': move_targets,
+            'nfa_accepts': accepts,
+            'actions': [self._action_value(action) for _, action in self.yalex_data['rules']],
+            'action_modes': [self._action_mode(action) for _, action in self.yalex_data['rules']],
+            'keywords': self.build_keyword_tables(),
+        }
+
+    @staticmethod
+    def _successor_lists(num_states, class_members, first_state=0):
+        # Sucesores de cada estado del NFA como listas planas: los de s son
+        # classes/targets[offsets[s]:offsets[s + 1]]. Con máscaras absolutas
+        # el tamaño crecía con el cuadrado del NFA
+        successors = [[] for _ in range(num_states)]
+        for class_id, members in enumerate(class_members):
+            for state_id, dest in members:
+                if first_state <= state_id < first_state + num_states:
+                    successors[state_id - first_state].append((class_id, dest))
+        offsets = [0]
+        classes = []
+        targets = []
+        for pairs in successors:
+            for class_id, dest in sorted(pairs):
+                classes.append(class_id)
+                targets.append(dest)
+            offsets.append(len(classes))
+        return offsets, classes, targets
+
+    @staticmethod
+    def _write_packed(f, name, values):
+        # Tabla de enteros empaquetada en el tipo de array más pequeño que la
+        # contiene (little-endian, zlib, base64): el módulo la decodifica una
+        # sola vez al importarse en vez de compilar un literal enorme
+        low, high = min(values, default=0), max(values, default=0)
+        ranges = [(code, -(1 << (bits - 1)), 1 << (bits - 1)) for code, bits in (('b', 8), ('h', 16), ('i', 32), ('q', 64))]
+        # Máscaras de 64 posiciones con el bit 63 encendido: sin signo
+        typecode = next(code for code, lowest, limit in ranges + [('Q', 0, 1 << 64)]
+                        if lowest <= low and high < limit)
+        table = array(typecode, values)
+        if sys.byteorder == 'big':
+            table.byteswap()
+        data = base64.b64encode(zlib.compress(table.tobytes(), 9)).decode('ascii')
+        f.write(f"{name} = _unpack({typecode!r}, (\n")
+        for start in range(0, len(data), 96):
+            f.write(f"    '{data[start:start + 96]}'\n")
+        f.write("))\n")
+
+    def _write_moves_row_method(self, f):
+        f.write("    @staticmethod\n")
+        f.write("    def _moves_row(moves, offsets, classes, targets, position):\n")
+        f.write("        # Class -> bitmask of next NFA states, from the packed successor lists\n")
+        f.write("        row = {}\n")
+        f.write("        for k in range(offsets[position], offsets[position + 1]):\n")
+        f.write("            row[classes[k]] = row.get(classes[k], 0) | (1 << targets[k])\n")
+        f.write("        moves[position] = row\n")
+        f.write("        return row\n\n")
+
+    def _write_lazy_methods(self, f):
+        self._write_moves_row_method(f)
+        f.write("    def _lazy_state(self, mask):\n")
+        f.write("        state = self.dfa_cache.get(mask)\n")
+        f.write("        if state is None:\n")
+        f.write("            state = len(self.dfa_masks)\n")
+        f.write("            self.dfa_cache[mask] = state\n")
+        f.write("            self.dfa_masks.append(mask)\n")
+        f.write("            self.dfa_rows.append({})\n")
+        f.write("            best = -1\n")
+        f.write("            accepting = mask & self.nfa_accept_mask\n")
+        f.write("            while accepting:\n")
+        f.write("                low = accepting & -accepting\n")
+        f.write("                accepting ^= low\n")
+        f.write("                rule = self.nfa_accepts[low.bit_length() - 1]\n")
+        f.write("                if best < 0 or rule < best:\n")
+        f.write("                    best = rule\n")
+        f.write("            self.dfa_accepts.append(best)\n")
+        f.write("        return state\n\n")
+        
+        f.write("    def _lazy_step(self, state, char_class):\n")
+        f.write("        # Determinize one transition; flush the whole cache only when a new state does not fit\n")
+        f.write("        mask = self.dfa_masks[state]\n")
+        f.write("        target = 0\n")
+        f.write("        nfa_moves = self.nfa_moves\n")
+        f.write("        while mask:\n")
+        f.write("            low = mask & -mask\n")
+        f.write("            mask ^= low\n")
+        f.write("            position = low.bit_length() - 1\n")
+        f.write("            moves = nfa_moves[position]\n")
+        f.write("            if moves is None:\n")
+        f.write("                moves = self._moves_row(nfa_moves, self.nfa_offsets, self.nfa_classes, self.nfa_targets, position)\n")
+        f.write("            target |= moves.get(char_class, 0)\n")
+        f.write("        if not target:\n")
+        f.write("            self.dfa_rows[state][char_class] = -1\n")
+        f.write("            return -1\n")
+        f.write("        next_state = self.dfa_cache.get(target)\n")
+        f.write("        if next_state is None:\n")
+        f.write("            if len(self.dfa_masks) >= self.dfa_cache_limit:\n")
+        f.write("                current = self.dfa_masks[state]\n")
+        f.write("                self.dfa_cache.clear()\n")
+        f.write("                del self.dfa_masks[:]\n")
+        f.write("                del self.dfa_rows[:]\n")
+        f.write("                del self.dfa_accepts[:]\n")
+        f.write("                state = self._lazy_state(current)\n")
+        f.write("            next_state = self._lazy_state(target)\n")
+        f.write("        self.dfa_rows[state][char_class] = next_state\n")
+        f.write("        return next_state\n\n")
+
+    def _write_vm_method(self, f):
+        self._write_moves_row_method(f)
+        f.write("    def _vm_match(self, states):\n")
+        f.write("        # Step a set of NFA states over the input; longest match, lowest rule wins ties\n")
+        f.write("        text = self.input\n")
+        f.write("        vm_moves = self.vm_moves\n")
+        f.write("        last_rule = -1\n")
+        f.write("        last_end = self.position\n")
+        f.write("        for j in range(self.position, len(text)):\n")
+        f.write("            code = ord(text[j])\n")
+        f.write("            if code < 128:\n")
+        f.write("                char_class = self.ascii_classes[code]\n")
+        f.write("            else:\n")
+        f.write("                char_class = self.interval_classes[bisect_right(self.class_bounds, code) - 1]\n")
+        f.write("            target = 0\n")
+        f.write("            while states:\n")
+        f.write("                low = states & -states\n")
+        f.write("                states ^= low\n")
+        f.write("                position = low.bit_length() - 1\n")
+        f.write("                moves = vm_moves[position]\n")
+        f.write("                if moves is None:\n")
+        f.write("                    moves = self._moves_row(vm_moves, self.vm_offsets, self.vm_classes, self.vm_targets, position)\n")
+        f.write("                target |= moves.get(char_class, 0)\n")
+        f.write("            states = target\n")
+        f.write("            if not states:\n")
+        f.write("                break\n")
+        f.write("            accepting = states & self.vm_accept_mask\n")
+        f.write("            if accepting:\n")
+        f.write("                last_rule = -1\n")
+        f.write("                while accepting:\n")
+        f.write("                    low = accepting & -accepting\n")
+        f.write("                    accepting ^= low\n")
+        f.write("                    rule = self.vm_accepts[low.bit_length() - 1]\n")
+        f.write("                    if last_rule < 0 or rule < last_rule:\n")
+        f.write("                        last_rule = rule\n")
+        f.write("                last_end = j + 1\n")
+        f.write("        return last_rule, last_end\n\n")
+
+    def _write_glushkov_methods(self, f):
+        f.write("    def _glushkov_match(self, pack):\n")
+        f.write("        # Shift-And style simulation; bit 0 is the initial state\n")
+        f.write("        char_masks, last_mask, position_rules = self.glushkov[pack]\n")
+        f.write("        chunks = self.glushkov_chunks[pack]\n")
+        f.write("        text = self.input\n")
+        f.write("        state = 1\n")
+        f.write("        last_rule = -1\n")
+        f.write("        last_end = self.position\n")
+        f.write("        for j in range(self.position, len(text)):\n")
+        f.write("            code = ord(text[j])\n")
+        f.write("            if code < 128:\n")
+        f.write("                char_class = self.ascii_classes[code]\n")
+        f.write("            else:\n")
+        f.write("                char_class = self.interval_classes[bisect_right(self.class_bounds, code) - 1]\n")
+        f.write("            reach = 0\n")
+        f.write("            chunk = 0\n")
+        f.write("            while state:\n")
+        f.write("                reach |= chunks[chunk][state & 255]\n")
+        f.write("                state >>= 8\n")
+        f.write("                chunk += 1\n")
+        f.write("            state = reach & char_masks[char_class]\n")
+        f.write("            if not state:\n")
+        f.write("                break\n")
+        f.write("            accepting = state & last_mask\n")
+        f.write("            if accepting:\n")
+        f.write("                last_rule = position_rules[(accepting & -accepting).bit_length() - 1]\n")
+        f.write("                last_end = j + 1\n")
+        f.write("        return last_rule, last_end\n\n")
+
+    def _table_options(self):
+        # Opciones que cambian las tablas; lazy_cache_size solo se escribe
+        # en el código generado
+        return {
+            'engine': self.engine,
+            'eliminate_epsilons': self.eliminate_epsilons,
+            'minimize': self.minimize,
+            'simplify': self.simplify,
+            'backend': self.backend,
+            'max_dfa_states': self.max_dfa_states,
+            'max_dfa_transitions': self.max_dfa_transitions,
+            'glushkov_min_blowup': self.glushkov_min_blowup,
+        }
+
+    def compile_tables(self):
+        if self.jobs == 1:
+            return self._compile_tables()
+        with ProcessPoolExecutor(max_workers=self.jobs) as pool:
+            self.pool = pool
+            try:
+                return self._compile_tables()
+            finally:
+                self.pool = None
+
+    def _compile_tables(self):
+        report = self.report
+        with report.phase("regex parse") as record:
+            self.build_regex_trees()
+            record['rules'] = len(report.rules)
+            record['cached_rules'] = sum(rule['cached'] for rule in report.rules)
+            record['tree_nodes'] = sum(rule['tree_nodes'] for rule in report.rules)
+        if self.engine == "thompson":
+            with report.phase("nfa build") as record:
+                self.build_nfas()
+                record['nfa_states'] = sum(rule['nfa_states'] for rule in report.rules)
+                record['nfa_transitions'] = sum(rule['nfa_transitions'] for rule in report.rules)
+        if self.cache is not None:
+            with report.phase("rule cache store"):
+                self.store_rule_cache()
+
+        if self.backend == "lazy":
+            for rule in report.rules:
+                rule['matcher'] = "lazy"
+            with report.phase("tables"):
+                return self.build_lazy_tables()
+
+        with report.phase("determinization") as record:
+            if self.backend == "glushkov":
+                self.select_glushkov_rules()
+            self.build_dfas()
+            self._record_dfas(record)
+            record['glushkov_rules'] = len(self.glushkov_rules)
+            record['fallback_rules'] = len(self.fallback_rules)
+        for i, rule in enumerate(report.rules):
+            rule['matcher'] = ("glushkov" if i in self.glushkov_rules else
+                               "nfa" if i in self.fallback_rules else "dfa")
+        if self.minimize:
+            with report.phase("minimization") as record:
+                self.minimize_dfas()
+                self._record_dfas(record)
+        with report.phase("tables"):
+            return self.build_tables()
+
+    def _record_dfas(self, record):
+        sizes = [BuildReport.automaton_size(dfa) for dfa in self.dfas]
+        record['dfas'] = len(sizes)
+        record['dfa_states'] = sum(states for states, _ in sizes)
+        record['dfa_transitions'] = sum(transitions for _, transitions in sizes)
+
     def generate_lexer(self, output_file=None):
         if not output_file:
             output_file = os.path.splitext(self.yalex_file)[0] + ".py"
         
-        self.parse_yalex()
-        self.build_regex_trees()
-        self.build_nfas()
-        self.build_dfas()
+        with self.report.phase("spec parse") as record:
+            self.parse_yalex()
+            record['rules'] = len(self.yalex_data['rules'])
+            record['definitions'] = len(self.yalex_data['definitions'])
+            record['modes'] = len(self.yalex_data['entrypoints'])
+        tables = None
+        if self.cache is not None:
+            with self.report.phase("cache lookup") as record:
+                key = BuildCache.key(self.yalex_data, self._table_options())
+                tables = self.cache.load(key)
+                record['hit'] = tables is not None
+            if tables is not None:
+                print(f"Using cached tables {key[:12]}")
+        
+        if tables is None:
+            tables = self.compile_tables()
+            if self.cache is not None:
+                with self.report.phase("cache store"):
+                    self.cache.store(key, tables)
         
-        with open(output_file, 'w', encoding='utf-8') as f:
+        with self.report.phase("codegen") as record, open(output_file, 'w', encoding='utf-8') as f:
             if self.yalex_data['header']:
                 f.write(f"{self.yalex_data['header']}\n\n")
             
+            f.write("import base64\n")
+            f.write("import sys\n")
+            f.write("import zlib\n")
+            f.write("from array import array\n")
+            f.write("from bisect import bisect_right\n")
             f.write("from collections import defaultdict\n\n")
+            f.write("def _unpack(typecode, data):\n")
+            f.write("    table = array(typecode)\n")
+            f.write("    table.frombytes(zlib.decompress(base64.b64decode(''.join(data))))\n")
+            f.write("    if sys.byteorder == 'big':\n")
+            f.write("        table.byteswap()\n")
+            f.write("    return table.tolist()\n\n")
             f.write("class Token:\n")
             f.write("    def __init__(self, type, value=None, position=None):\n")
             f.write("        self.type = type\n")
@@ -795,6 +2985,60 @@ class LexerGenerator:
             f.write("            return f\"{self.type}({self.value}) at {self.position}\"\n")
             f.write("        return f\"{self.type} at {self.position}\"\n\n")
             
+            # Tables shared by every Lexer, decoded once at import; class_bounds[k]
+            # starts a run of code points that all belong to interval_classes[k]
+            f.write("# Character classes\n")
+            self._write_packed(f, "_CLASS_BOUNDS", tables['class_bounds'])
+            self._write_packed(f, "_INTERVAL_CLASSES", tables['interval_classes'])
+            f.write("_ASCII_CLASSES = [_INTERVAL_CLASSES[bisect_right(_CLASS_BOUNDS, code) - 1] for code in range(128)]\n\n")
+            
+            if tables['backend'] == 'table':
+                # DFA transitions, num_classes entries per state (-1 = no transition)
+                f.write("# DFA transitions and accepting rule per state (-1 = none)\n")
+                self._write_packed(f, "_TRANSITIONS", tables['transitions'])
+                self._write_packed(f, "_ACCEPTS", tables['accepts'])
+                f.write("\n")
+                
+                if tables['vm_accepts']:
+                    # Rules over the DFA budget run on an NFA simulation instead
+                    f.write("# NFA for rules simulated outside the DFA, successors packed like the lazy backend's\n")
+                    self._write_packed(f, "_VM_OFFSETS", tables['vm_offsets'])
+                    self._write_packed(f, "_VM_CLASSES", tables['vm_classes'])
+                    self._write_packed(f, "_VM_TARGETS", tables['vm_targets'])
+                    self._write_packed(f, "_VM_ACCEPTS", tables['vm_accepts'])
+                    f.write("_VM_ACCEPT_MASK = sum(1 << i for i, rule in enumerate(_VM_ACCEPTS) if rule >= 0)\n")
+                    f.write("# class -> bitmask of next NFA states, filled the first time a state is reached\n")
+                    f.write("_VM_MOVES = [None] * len(_VM_ACCEPTS)\n\n")
+                
+                if tables['glushkov']:
+                    # Follow sets precomputed one table per byte of the state mask;
+                    # rule per position padded to pack_positions entries per pack
+                    pack_positions = GlushkovBuilder.pack_positions
+                    chunk_size = 256 * (pack_positions // 8)
+                    num_classes = tables['num_classes']
+                    f.write("# Glushkov follow tables: byte value -> union of follow sets, 256 per byte of each pack\n")
+                    self._write_packed(f, "_GLUSHKOV_FOLLOW", [value for matcher in tables['glushkov'] for value in matcher[0]])
+                    f.write(f"_GLUSHKOV_CHUNKS = [[_GLUSHKOV_FOLLOW[k:k + 256] for k in range(pack, pack + {chunk_size}, 256)]\n")
+                    f.write(f"                    for pack in range(0, len(_GLUSHKOV_FOLLOW), {chunk_size})]\n")
+                    f.write("# Glushkov matchers: positions per class, accepting positions and rule per position\n")
+                    self._write_packed(f, "_GLUSHKOV_CLASS_MASKS", [mask for matcher in tables['glushkov'] for mask in matcher[1]])
+                    self._write_packed(f, "_GLUSHKOV_LAST_MASKS", [matcher[2] for matcher in tables['glushkov']])
+                    self._write_packed(f, "_GLUSHKOV_RULES", [rule for matcher in tables['glushkov'] for rule
+                                                              in matcher[3] + [-1] * (pack_positions - len(matcher[3]))])
+                    f.write(f"_GLUSHKOV = [(_GLUSHKOV_CLASS_MASKS[pack * {num_classes}:(pack + 1) * {num_classes}], last_mask,\n")
+                    f.write(f"              _GLUSHKOV_RULES[pack * {pack_positions}:(pack + 1) * {pack_positions}])\n")
+                    f.write("             for pack, last_mask in enumerate(_GLUSHKOV_LAST_MASKS)]\n\n")
+            else:
+                # Epsilon-free NFA; DFA states are built from it on demand
+                f.write("# NFA successors: those of state s are _NFA_CLASSES/_NFA_TARGETS[_NFA_OFFSETS[s]:_NFA_OFFSETS[s + 1]]\n")
+                self._write_packed(f, "_NFA_OFFSETS", tables['nfa_offsets'])
+                self._write_packed(f, "_NFA_CLASSES", tables['nfa_classes'])
+                self._write_packed(f, "_NFA_TARGETS", tables['nfa_targets'])
+                self._write_packed(f, "_NFA_ACCEPTS", tables['nfa_accepts'])
+                f.write("_NFA_ACCEPT_MASK = sum(1 << i for i, rule in enumerate(_NFA_ACCEPTS) if rule >= 0)\n")
+                f.write("# class -> bitmask of next NFA states, filled the first time a state is reached\n")
+                f.write("_NFA_MOVES = [None] * len(_NFA_ACCEPTS)\n\n")
+            
             f.write("class Lexer:\n")
             f.write("    def __init__(self, input_text):\n")
             f.write("        self.input = input_text\n")
@@ -802,126 +3046,169 @@ class LexerGenerator:
             f.write("        self.line = 1\n")
             f.write("        self.column = 1\n")
             
-            # Write the DFA transitions
-            f.write("\n        # DFA transitions\n")
-            f.write("        self.dfas = []\n")
-            for i, dfa in enumerate(self.dfas):
-                f.write(f"        # DFA {i}\n")
-                f.write(f"        dfa_{i}_states = []\n")
-                f.write(f"        dfa_{i}_transitions = []\n")
+            # Write the lexer modes; every mode starts somewhere in the same table
+            f.write("\n        # Lexer modes (entrypoints)\n")
+            f.write(f"        self.modes = {tables['modes']!r}\n")
+            f.write(f"        self.mode_starts = {tables['mode_starts']!r}\n")
+            f.write("        self.mode = 0\n")
+            
+            # Character classes
+            f.write("\n        # Character classes\n")
+            f.write("        self.class_bounds = _CLASS_BOUNDS\n")
+            f.write("        self.interval_classes = _INTERVAL_CLASSES\n")
+            f.write(f"        self.num_classes = {tables['num_classes']}\n")
+            f.write("        self.ascii_classes = _ASCII_CLASSES\n")
+            
+            if tables['backend'] == 'table':
+                f.write("\n        # DFA transitions and accepting rule per state\n")
+                f.write("        self.transitions = _TRANSITIONS\n")
+                f.write("        self.accepts = _ACCEPTS\n\n")
                 
-                for state in dfa.states:
-                    f.write(f"        # State {state.id}\n")
-                    transitions = defaultdict(list)
-                    for symbol, dest in state.transitions.items():
-                        # Handle special characters properly
-                        if symbol == '\n':
-                            symbol_repr = "'\\n'"
-                        elif symbol == '\t':
-                            symbol_repr = "'\\t'"
-                        elif symbol == ' ':
-                            symbol_repr = "' '"
-                        elif symbol == "'":
-                            symbol_repr = '"\'"'
-                        elif symbol == '"':
-                            symbol_repr = "'\"'"
-                        elif symbol == '\\':
-                            symbol_repr = "'\\\\'"
-                        else:
-                            symbol_repr = f"'{symbol}'"
-                        transitions[dest.id].append(symbol_repr)
-                    
-                    transition_code = []
-                    for dest_id, symbols in transitions.items():
-                        transition_code.append(f"({dest_id}, {{{', '.join(symbols)}}})")
-                    
-                    transition_str = ', '.join(transition_code)
-                    f.write(f"        dfa_{i}_transitions.append([{transition_str}])\n")
-                    f.write(f"        dfa_{i}_states.append({'True' if state.is_accepting else 'False'})\n")
+                if tables['vm_accepts']:
+                    f.write("        # NFA for rules simulated outside the DFA (-1 = none in mode)\n")
+                    f.write(f"        self.vm_starts = {tables['vm_starts']!r}\n")
+                    f.write("        self.vm_offsets = _VM_OFFSETS\n")
+                    f.write("        self.vm_classes = _VM_CLASSES\n")
+                    f.write("        self.vm_targets = _VM_TARGETS\n")
+                    f.write("        self.vm_moves = _VM_MOVES\n")
+                    f.write("        self.vm_accepts = _VM_ACCEPTS\n")
+                    f.write("        self.vm_accept_mask = _VM_ACCEPT_MASK\n\n")
+                
+                if tables['glushkov']:
+                    # Small rules run as bit-parallel position automata
+                    f.write("        # Glushkov matchers: (class masks, last mask, rule per position)\n")
+                    f.write("        self.glushkov = _GLUSHKOV\n")
+                    f.write(f"        self.mode_glushkov = {tables['mode_glushkov']!r}\n")
+                    f.write("        self.glushkov_chunks = _GLUSHKOV_CHUNKS\n\n")
+            else:
+                f.write("\n        # NFA moves: class -> bitmask of next NFA states\n")
+                f.write("        self.nfa_offsets = _NFA_OFFSETS\n")
+                f.write("        self.nfa_classes = _NFA_CLASSES\n")
+                f.write("        self.nfa_targets = _NFA_TARGETS\n")
+                f.write("        self.nfa_moves = _NFA_MOVES\n")
+                f.write("        self.nfa_accepts = _NFA_ACCEPTS\n")
+                f.write("        self.nfa_accept_mask = _NFA_ACCEPT_MASK\n\n")
                 
-                f.write(f"        self.dfas.append((dfa_{i}_states, dfa_{i}_transitions))\n\n")
+                f.write("        # Lazily built DFA: NFA state set -> index, flushed when full\n")
+                f.write(f"        self.dfa_cache_limit = {self.lazy_cache_size}\n")
+                f.write("        self.dfa_cache = {}\n")
+                f.write("        self.dfa_masks = []\n")
+                f.write("        self.dfa_rows = []\n")
+                f.write("        self.dfa_accepts = []\n\n")
             
             # Write the actions
             f.write("        # Token actions\n")
             f.write("        self.actions = [\n")
-            for _, action in self.yalex_data['rules']:
-                # Extract just the return value without 'return '
-                action_value = action.split('return ')[1].strip() if 'return' in action else action
-                f.write(f"            '{action_value}',\n")
-            f.write("        ]\n\n")
+            for action_value in tables['actions']:
+                f.write(f"            {action_value!r},\n")
+            f.write("        ]\n")
+            f.write(f"        self.action_modes = {tables['action_modes']!r}\n\n")
+            
+            # Write the reserved words, applied after the owning token matches
+            f.write("        # Reserved words\n")
+            f.write("        self.keywords = {\n")
+            for token, words in tables['keywords'].items():
+                f.write(f"            {token!r}: {{\n")
+                for word, keyword_token in words.items():
+                    f.write(f"                {word!r}: {keyword_token!r},\n")
+                f.write("            },\n")
+            f.write("        }\n\n")
+            
+            f.write("    def set_mode(self, mode):\n")
+            f.write("        self.mode = self.modes.index(mode) if isinstance(mode, str) else mode\n\n")
+            
+            if tables['backend'] == 'lazy':
+                self._write_lazy_methods(f)
+            else:
+                if tables['vm_accepts']:
+                    self._write_vm_method(f)
+                if tables['glushkov']:
+                    self._write_glushkov_methods(f)
             
             # Write the next_token method
             f.write("    def next_token(self):\n")
-            f.write("        if self.position >= len(self.input):\n")
-            f.write("            return Token('EOF', position=(self.line, self.column))\n\n")
-            
-            f.write("        # Skip whitespace (but we actually tokenize it in this case)\n")
-            f.write("        # while self.position < len(self.input) and self.input[self.position].isspace():\n")
-            f.write("        #     if self.input[self.position] == '\\n':\n")
-            f.write("        #         self.line += 1\n")
-            f.write("        #         self.column = 1\n")
-            f.write("        #     else:\n")
-            f.write("        #         self.column += 1\n")
-            f.write("        #     self.position += 1\n\n")
-            
-            f.write("        if self.position >= len(self.input):\n")
-            f.write("            return Token('EOF', position=(self.line, self.column))\n\n")
-            
-            f.write("        longest_match = None\n")
-            f.write("        longest_length = 0\n")
-            f.write("        matching_action = None\n\n")
-            
-            f.write("        # Try each DFA to find the longest match\n")
-            f.write("        for i, (states, transitions) in enumerate(self.dfas):\n")
-            f.write("            current_state = 0  # Start state\n")
-            f.write("            current_length = 0\n")
-            f.write("            last_accepting_state = None\n")
-            f.write("            last_accepting_length = 0\n\n")
-            
-            f.write("            for j in range(self.position, len(self.input)):\n")
-            f.write("                char = self.input[j]\n")
-            f.write("                found = False\n")
-            f.write("                for dest, symbols in transitions[current_state]:\n")
-            f.write("                    if char in symbols:\n")
-            f.write("                        current_state = dest\n")
-            f.write("                        current_length += 1\n")
-            f.write("                        found = True\n")
-            f.write("                        if states[current_state]:\n")
-            f.write("                            last_accepting_state = current_state\n")
-            f.write("                            last_accepting_length = current_length\n")
-            f.write("                        break\n")
-            f.write("                if not found:\n")
-            f.write("                    break\n\n")
-            
-            f.write("            # Use the last accepting state if we couldn't consume all characters\n")
-            f.write("            if last_accepting_state is not None and last_accepting_length > longest_length:\n")
-            f.write("                longest_match = self.input[self.position:self.position + last_accepting_length]\n")
-            f.write("                longest_length = last_accepting_length\n")
-            f.write("                matching_action = self.actions[i]\n\n")
-            
-            f.write("        if longest_match is not None:\n")
-            f.write("            token_type = matching_action\n")
+            f.write("        while True:\n")
+            f.write("            if self.position >= len(self.input):\n")
+            f.write("                return Token('EOF', position=(self.line, self.column))\n\n")
+            
+            f.write("            # Run the current mode's DFA to find the longest match\n")
+            f.write("            text = self.input\n")
+            f.write("            ascii_classes = self.ascii_classes\n")
+            if tables['backend'] == 'table':
+                f.write("            transitions = self.transitions\n")
+                f.write("            accepts = self.accepts\n")
+                f.write("            num_classes = self.num_classes\n")
+                f.write("            state = self.mode_starts[self.mode]\n")
+            else:
+                f.write("            rows = self.dfa_rows\n")
+                f.write("            accepts = self.dfa_accepts\n")
+                f.write("            state = self._lazy_state(1 << self.mode_starts[self.mode])\n")
+            f.write("            last_rule = -1\n")
+            f.write("            last_end = self.position\n\n")
+            
+            f.write("            for j in range(self.position, len(text)):\n")
+            f.write("                code = ord(text[j])\n")
+            f.write("                if code < 128:\n")
+            f.write("                    char_class = ascii_classes[code]\n")
+            f.write("                else:\n")
+            f.write("                    char_class = self.interval_classes[bisect_right(self.class_bounds, code) - 1]\n")
+            if tables['backend'] == 'table':
+                f.write("                state = transitions[state * num_classes + char_class]\n")
+            else:
+                f.write("                next_state = rows[state].get(char_class)\n")
+                f.write("                if next_state is None:\n")
+                f.write("                    next_state = self._lazy_step(state, char_class)\n")
+                f.write("                state = next_state\n")
+            f.write("                if state < 0:\n")
+            f.write("                    break\n")
+            f.write("                if accepts[state] >= 0:\n")
+            f.write("                    last_rule = accepts[state]\n")
+            f.write("                    last_end = j + 1\n\n")
+            
+            if tables['backend'] == 'table' and tables['vm_accepts']:
+                f.write("            if self.vm_starts[self.mode] >= 0:\n")
+                f.write("                vm_rule, vm_end = self._vm_match(1 << self.vm_starts[self.mode])\n")
+                f.write("                if vm_rule >= 0 and (vm_end > last_end or (vm_end == last_end and (last_rule < 0 or vm_rule < last_rule))):\n")
+                f.write("                    last_rule = vm_rule\n")
+                f.write("                    last_end = vm_end\n\n")
+            if tables['backend'] == 'table' and tables['glushkov']:
+                f.write("            for pack in self.mode_glushkov[self.mode]:\n")
+                f.write("                rule, end = self._glushkov_match(pack)\n")
+                f.write("                if rule >= 0 and (end > last_end or (end == last_end and (last_rule < 0 or rule < last_rule))):\n")
+                f.write("                    last_rule = rule\n")
+                f.write("                    last_end = end\n\n")
+            
+            f.write("            if last_rule < 0:\n")
+            f.write("                # No match found - return error token\n")
+            f.write("                error_char = text[self.position]\n")
+            f.write("                error_pos = (self.line, self.column)\n")
+            f.write("                self.position += 1\n")
+            f.write("                self.column += 1\n")
+            f.write("                return Token('ERROR', error_char, error_pos)\n\n")
+            
+            f.write("            longest_match = text[self.position:last_end]\n")
             f.write("            start_pos = (self.line, self.column)\n")
             f.write("            \n")
             f.write("            # Update position\n")
-            f.write("            for char in longest_match:\n")
-            f.write("                if char == '\\n':\n")
-            f.write("                    self.line += 1\n")
-            f.write("                    self.column = 1\n")
-            f.write("                else:\n")
-            f.write("                    self.column += 1\n")
-            f.write("            \n")
-            f.write("            self.position += longest_length\n")
-            f.write("            end_pos = (self.line, self.column)\n")
-            f.write("            \n")
-            f.write("            return Token(token_type, longest_match, (start_pos, end_pos))\n")
-            f.write("        \n")
-            f.write("        # No match found - return error token\n")
-            f.write("        error_char = self.input[self.position]\n")
-            f.write("        error_pos = (self.line, self.column)\n")
-            f.write("        self.position += 1\n")
-            f.write("        self.column += 1\n")
-            f.write("        return Token('ERROR', error_char, error_pos)\n\n")
+            f.write("            newlines = longest_match.count('\\n')\n")
+            f.write("            if newlines:\n")
+            f.write("                self.line += newlines\n")
+            f.write("                self.column = len(longest_match) - longest_match.rfind('\\n')\n")
+            f.write("            else:\n")
+            f.write("                self.column += len(longest_match)\n")
+            f.write("            self.position = last_end\n")
+            f.write("            end_pos = (self.line, self.column)\n\n")
+            
+            f.write("            if self.action_modes[last_rule] is not None:\n")
+            f.write("                self.mode = self.action_modes[last_rule]\n")
+            f.write("            token_type = self.actions[last_rule]\n")
+            f.write("            if token_type is None:\n")
+            f.write("                continue\n\n")
+            
+            f.write("            reserved = self.keywords.get(token_type)\n")
+            f.write("            if reserved is not None:\n")
+            f.write("                token_type = reserved.get(longest_match, token_type)\n")
+            f.write("            return Token(token_type, longest_match, (start_pos, end_pos))\n\n")
             
             f.write("    def tokenize(self):\n")
             f.write("        tokens = []\n")
@@ -934,17 +3221,73 @@ class LexerGenerator:
             
             if self.yalex_data['trailer']:
                 f.write(f"\n{self.yalex_data['trailer']}\n")
+            record['bytes'] = f.tell()
         
         print(f"Lexer generated successfully at {output_file}")
 
 # Example usage
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python yalex_generator.py <input.yal> [output.py]")
-        sys.exit(1)
-    
-    input_file = sys.argv[1]
-    output_file = sys.argv[2] if len(sys.argv) > 2 else None
+    arg_parser = argparse.ArgumentParser(description="Generate a lexer from a YALex specification")
+    arg_parser.add_argument("input_file", help="YALex specification (.yal)")
+    arg_parser.add_argument("output_file", nargs="?", help="generated lexer (defaults to <input>.py)")
+    arg_parser.add_argument("--engine", choices=("thompson", "direct"), default="thompson",
+                            help="regex to DFA construction: Thompson NFA + subsets, or direct followpos")
+    arg_parser.add_argument("--eliminate-epsilons", action="store_true",
+                            help="remove epsilon transitions before subset construction")
+    arg_parser.add_argument("--no-simplify", action="store_true",
+                            help="build the automata from the regex trees exactly as parsed")
+    arg_parser.add_argument("--no-minimize", action="store_true",
+                            help="keep the DFAs produced by the construction without minimizing them")
+    arg_parser.add_argument("--backend", choices=("table", "lazy", "glushkov"), default="table",
+                            help="full DFA tables, an NFA determinized on demand by the generated lexer, "
+                                 "or bit-parallel position automata for small rules plus DFA tables (each "
+                                 "automaton pack is one more pass per token, so glushkov only pays off for "
+                                 "rules whose DFA blows up; see --glushkov-min-blowup)")
+    arg_parser.add_argument("--glushkov-min-blowup", type=float,
+                            help="with --backend glushkov, only simulate rules whose own DFA has at least this "
+                                 "many states per position (each candidate's DFA is probed to decide); rules "
+                                 "without such growth, as in most specs, stay in the DFA and the backend then "
+                                 "produces the same tables as table")
+    arg_parser.add_argument("--lazy-cache-size", type=int, default=4096,
+                            help="DFA states the lazy backend keeps before flushing its cache")
+    arg_parser.add_argument("--max-dfa-states", type=int,
+                            help="DFA state budget; rules over it are simulated as an NFA by the lexer")
+    arg_parser.add_argument("--max-dfa-transitions", type=int,
+                            help="DFA transition budget; rules over it are simulated as an NFA by the lexer")
+    arg_parser.add_argument("--cache-dir",
+                            default=os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                                                 "yalex"),
+                            help="directory of compiled tables reused while the spec and options are unchanged")
+    arg_parser.add_argument("--cache-size", type=int, default=64,
+                            help="megabytes the cache may use before evicting the least recently used tables")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="always compile the tables, without reading or writing the cache")
+    arg_parser.add_argument("--jobs", type=int, default=1,
+                            help="processes that parse the rules and build their automata in parallel; "
+                                 "a mode's rules are determinized in blocks and merged, while minimization "
+                                 "runs one mode per process")
+    arg_parser.add_argument("--render", choices=("png", "svg", "dot"),
+                            help="also draw the regex trees, NFAs and DFAs; graphs whose DOT source did not "
+                                 "change since the last run are skipped")
+    arg_parser.add_argument("--render-dir", default="output",
+                            help="directory of the rendered graphs")
+    arg_parser.add_argument("--render-max-states", type=int, default=200,
+                            help="states drawn per automaton; the rest are summarized in a single node")
+    arg_parser.add_argument("--profile", metavar="REPORT",
+                            help="write a JSON report with the time, peak memory and sizes of each build "
+                                 "phase and of each rule ('-' prints it; progress then goes to stderr)")
+    args = arg_parser.parse_args()
     
-    generator = LexerGenerator(input_file)
-    generator.generate_lexer(output_file)
\ No newline at end of file
+    cache = None if args.no_cache else BuildCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    generator = LexerGenerator(args.input_file, eliminate_epsilons=args.eliminate_epsilons, engine=args.engine,
+                               minimize=not args.no_minimize, simplify=not args.no_simplify, backend=args.backend,
+                               lazy_cache_size=args.lazy_cache_size, max_dfa_states=args.max_dfa_states,
+                               max_dfa_transitions=args.max_dfa_transitions, cache=cache, jobs=args.jobs,
+                               profile=args.profile is not None, glushkov_min_blowup=args.glushkov_min_blowup)
+    # Con --profile - la salida estándar queda solo para el JSON del reporte
+    with redirect_stdout(sys.stderr) if args.profile == "-" else nullcontext():
+        generator.generate_lexer(args.output_file)
+        if args.render:
+            generator.render_automata(args.render_dir, args.render, args.render_max_states)
+    if args.profile:
+        generator.report.save(args.profile)
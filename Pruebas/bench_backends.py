@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Benchmark de rendimiento de los lexers generados por cada backend
+#
+#   python Pruebas/bench_backends.py [n1 n2 ...]
+#
+# Cada especificación tiene n palabras reservadas como reglas propias, ID,
+# NUM, espacios y una regla "tail" cuyo DFA crece exponencialmente con la
+# cola ('a'|'b')*'a'('a'|'b'){12}. El backend glushkov simula las primeras
+# reglas pequeñas en paralelo de bits; "glushkov/4" (--glushkov-min-blowup 4)
+# solo la regla tail. Se mide el tiempo de importar el módulo generado, de
+# crear un Lexer y de tokenizar el mismo texto con cada variante.
+import importlib.util
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from Parser import LexerGenerator
+
+# Nombre de la variante -> opciones de LexerGenerator
+BACKENDS = {
+    "table": {'backend': "table"},
+    "lazy": {'backend': "lazy"},
+    "glushkov": {'backend': "glushkov"},
+    "glushkov/4": {'backend': "glushkov", 'glushkov_min_blowup': 4},
+}
+
+
+def random_word(rng, letters="abcdefghijklmnopqrstuvwxyz"):
+    return ''.join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+
+
+def write_spec(path, keywords):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("let letter = ['a'-'z']\n")
+        f.write("let digit = ['0'-'9']\n")
+        f.write("rule tokens =\n")
+        f.write("    ('a'|'b')*'a'" + "('a'|'b')" * 12 + " { return TAIL }\n")
+        for i, word in enumerate(keywords):
+            f.write(f"  | \"{word}\" {{ return KW{i} }}\n")
+        f.write("  | letter (letter|digit)* { return ID }\n")
+        f.write("  | digit+ { return NUM }\n")
+        f.write("  | [' ' '\\n'] { return WS }\n")
+
+
+def random_text(rng, keywords, words):
+    # Mitad palabras reservadas, mitad identificadores, números y colas a/b
+    parts = []
+    for _ in range(words):
+        choice = rng.random()
+        if choice < 0.5:
+            parts.append(rng.choice(keywords))
+        elif choice < 0.8:
+            parts.append(random_word(rng))
+        elif choice < 0.9:
+            parts.append(str(rng.randrange(100000)))
+        else:
+            parts.append(''.join(rng.choice("ab") for _ in range(rng.randint(13, 20))))
+    return ' '.join(parts)
+
+
+def load(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run(sizes, words=30_000, seed=0):
+    print(f"{'reglas':>8} {'backend':>10} {'tamaño (KB)':>12} {'importar (s)':>13} "
+          f"{'Lexer() (ms)':>13} {'tokens':>7} {'tokenizar (s)':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            rng = random.Random(seed)
+            keywords = sorted({random_word(rng) for _ in range(size)})
+            spec_path = os.path.join(directory, f"kw{size}.yal")
+            write_spec(spec_path, keywords)
+            text = random_text(rng, keywords, words)
+
+            for number, (backend, options) in enumerate(BACKENDS.items()):
+                lexer_path = os.path.join(directory, f"kw{size}_{number}.py")
+                with redirect_stdout(io.StringIO()):
+                    LexerGenerator(spec_path, **options).generate_lexer(lexer_path)
+
+                start = time.perf_counter()
+                module = load(lexer_path, f"kw{size}_{number}")
+                import_time = time.perf_counter() - start
+
+                # Promedio de varios Lexer(): una sola medición es puro ruido
+                start = time.perf_counter()
+                for _ in range(100):
+                    lexer = module.Lexer(text)
+                init_time = (time.perf_counter() - start) / 100
+
+                start = time.perf_counter()
+                tokens = sum(1 for _ in lexer.tokenize())
+                elapsed = time.perf_counter() - start
+
+                print(f"{len(keywords):>8} {backend:>10} {os.path.getsize(lexer_path) / 1024:>12.0f} "
+                      f"{import_time:>13.3f} {init_time * 1000:>13.2f} {tokens:>7} {elapsed:>14.3f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 400, 1_000]
+    run(sizes)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Benchmark de escalamiento para RegexToDFA.minimize_dfa
+#
+#   python Pruebas/bench_minimize.py [n1 n2 ...]
+#
+# Cada DFA de prueba es un DFA aleatorio "base" de n/2 estados copiado dos
+# veces (las copias son equivalentes), así que el mínimo tiene a lo más
+# n/2 estados y el algoritmo tiene que fusionar la mitad de los estados.
+import random
+import sys
+import time
+
+from regex_to_dfa import RegexToDFA
+
+
+def random_dfa(num_states, alphabet, seed=0):
+    rng = random.Random(seed)
+    half = num_states // 2
+    base = {}
+    for state in range(half):
+        for symbol in alphabet:
+            # Algunas transiciones faltan, como en los DFAs del generador
+            if rng.random() < 0.9:
+                base[(state, symbol)] = rng.randrange(half)
+    finals = set(rng.sample(range(half), max(1, half // 10)))
+
+    transitions = {}
+    for (state, symbol), dest in base.items():
+        transitions[(state, symbol)] = dest if state % 2 else dest + half
+        transitions[(state + half, symbol)] = dest + half if state % 2 else dest
+
+    return {
+        'states': 2 * half,
+        'initial': 0,
+        'final_states': finals | {state + half for state in finals},
+        'transitions': transitions,
+    }
+
+
+def run(sizes, alphabet="abcd"):
+    print(f"{'estados':>10} {'transiciones':>13} {'mínimo':>8} {'tiempo (s)':>11}")
+    for size in sizes:
+        converter = RegexToDFA("a")
+        converter.alphabet = set(alphabet)
+        converter.dfa = random_dfa(size, alphabet)
+
+        start = time.perf_counter()
+        minimized = converter.minimize_dfa()
+        elapsed = time.perf_counter() - start
+
+        print(f"{size:>10} {len(converter.dfa['transitions']):>13} {minimized['states']:>8} {elapsed:>11.3f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 30_000, 100_000]
+    run(sizes)
@@ -1,8 +1,5 @@
 # -*- coding: utf-8 -*-
-import matplotlib.pyplot as plt
 from collections import deque, defaultdict
-import matplotlib.patches as patches
-import numpy as np
 import math
 import csv 
 import re
@@ -190,26 +187,35 @@ class RegexToDFA:
         # Caso 1: Para nodo con operador concat '·'
         if node.data == '·':
             for i in node.left.lastpos:
-                self.followpos[i] = self.followpos[i].union(node.right.firstpos)
+                self.followpos[i] |= node.right.firstpos
         
         # Caso 2: Para nodo con operador '*'
         if node.data in '*+':
             for i in node.lastpos:
-                self.followpos[i] = self.followpos[i].union(node.firstpos)
+                self.followpos[i] |= node.firstpos
         
         # Procesar recursivamente los nodos hijo
         self.calculate_followpos(node.left)
         self.calculate_followpos(node.right)
     
     def construct_dfa(self):
-        # Estado inicial: firstpos de la raíz
-        initial_state = frozenset(self.syntax_tree.firstpos)
-        
-        # Inicializar DFA
-        states = {initial_state: 0}  # Mapeo de conjuntos de posiciones a estados
-        unmarked_states = [initial_state]
-        transitions = {}
-        final_states = set()
+        # Los conjuntos de posiciones se representan como bitsets (int):
+        # el bit p está encendido si la posición p pertenece al estado
+        # (los operadores que también están en el alfabeto no tienen
+        # posición y aparecen como None; se ignoran)
+        followpos_bits = {}
+        for pos, follow in self.followpos.items():
+            bits = 0
+            for nxt in follow:
+                if nxt is not None:
+                    bits |= 1 << nxt
+            followpos_bits[pos] = bits
+        
+        # Índice símbolo -> posiciones; solo interesan los del alfabeto
+        position_symbol = {}
+        for pos, symbol in self.pos_to_symbol.items():
+            if symbol in self.alphabet:
+                position_symbol[pos] = symbol
         
         # Encontrar posición del símbolo de fin '#'
         end_pos = None
@@ -220,37 +226,52 @@ class RegexToDFA:
         
         if end_pos is None:
             raise ValueError("No se encontró el símbolo de fin '#'")
+        end_bit = 1 << end_pos
+        
+        # Estado inicial: firstpos de la raíz
+        initial_state = 0
+        for pos in self.syntax_tree.firstpos:
+            if pos is not None:
+                initial_state |= 1 << pos
+        
+        # Inicializar DFA
+        states = {initial_state: 0}  # Mapeo de conjuntos de posiciones a estados
+        unmarked_states = deque([initial_state])
+        transitions = {}
+        final_states = set()
         
         # Construir DFA usando el algoritmo de construcción directa
         while unmarked_states:
-            current_state = unmarked_states.pop(0)
+            current_state = unmarked_states.popleft()
+            src = states[current_state]
             
             # Si el estado contiene la posición del símbolo de fin, es un estado final
-            if end_pos in current_state:
-                final_states.add(states[current_state])
+            if current_state & end_bit:
+                final_states.add(src)
             
-            # Para cada símbolo en el alfabeto (excepto ε)
-            for symbol in self.alphabet:
-                # Calcular el Move(estado, símbolo)
-                next_state_positions = set()
-                for pos in current_state:
-                    if self.pos_to_symbol.get(pos) == symbol:
-                        next_state_positions = next_state_positions.union(self.followpos[pos])
-                
-                if not next_state_positions:
+            # Move(estado, símbolo) para todos los símbolos a la vez: se
+            # recorren solo las posiciones del estado y se acumula con OR
+            moves = {}
+            remaining = current_state
+            while remaining:
+                low = remaining & -remaining
+                remaining ^= low
+                pos = low.bit_length() - 1
+                symbol = position_symbol.get(pos)
+                if symbol is not None:
+                    moves[symbol] = moves.get(symbol, 0) | followpos_bits.get(pos, 0)
+            
+            for symbol, next_state in moves.items():
+                if not next_state:
                     continue
                 
-                next_state = frozenset(next_state_positions)
-                
                 # Si es un nuevo estado, agregarlo a los estados no marcados
                 if next_state not in states:
                     states[next_state] = len(states)
                     unmarked_states.append(next_state)
                 
                 # Añadir la transición
-                src = states[current_state]
-                dest = states[next_state]
-                transitions[(src, symbol)] = dest
+                transitions[(src, symbol)] = states[next_state]
         
         # Almacenar el DFA
         self.dfa = {
@@ -266,65 +287,95 @@ class RegexToDFA:
         if not self.dfa:
             raise ValueError("Primero debe construir el DFA")
         
-        # Algoritmo de Hopcroft para minimización de DFA
+        # Algoritmo de Hopcroft en O(n·|Σ|·log n) para minimización de DFA
         transitions = self.dfa['transitions']
         final_states = self.dfa['final_states']
         num_states = self.dfa['states']
         
-        # Inicializar particiones: estados finales y no finales
-        partitions = [
-            set(range(num_states)) - final_states,  # Estados no finales
-            final_states  # Estados finales
-        ]
-        # Eliminar particiones vacías
-        partitions = [p for p in partitions if p]
-        
-        workset = []
-        for partition in partitions:
-            if partition:
-                workset.append(partition)
-        
-        while workset:
-            current_set = workset.pop(0)
+        # Índice inverso: inverse[símbolo][destino] = estados que llegan a
+        # destino con ese símbolo. Se construye una sola vez en O(m).
+        inverse = defaultdict(lambda: defaultdict(list))
+        for (src, symbol), dest in transitions.items():
+            inverse[symbol][dest].append(src)
+        symbols = list(inverse)
+        
+        # Partición refinable con arreglos de bloques y posiciones:
+        # los estados del bloque b ocupan elems[first[b]:end[b]] y los
+        # marcados en la ronda actual están en elems[first[b]:mid[b]]
+        elems = [state for state in range(num_states) if state not in final_states]
+        num_non_final = len(elems)
+        elems.extend(state for state in range(num_states) if state in final_states)
+        loc = [0] * num_states
+        for i, state in enumerate(elems):
+            loc[state] = i
+        
+        first, end, mid = [], [], []
+        block_of = [0] * num_states
+        for lo, hi in ((0, num_non_final), (num_non_final, num_states)):
+            if lo < hi:
+                for i in range(lo, hi):
+                    block_of[elems[i]] = len(first)
+                first.append(lo)
+                end.append(hi)
+                mid.append(lo)
+        
+        # Worklist como conjunto de separadores (bloque, símbolo). Con un
+        # DFA parcial hay que empezar con todos los bloques iniciales.
+        workset = set((block, symbol) for block in range(len(first)) for symbol in symbols)
+        pending = list(workset)
+        
+        while pending:
+            splitter = pending.pop()
+            if splitter not in workset:
+                continue
+            workset.discard(splitter)
+            block, symbol = splitter
+            predecessors = inverse[symbol]
             
-            for symbol in self.alphabet:
-                # Encontrar estados que llevan a current_set con el símbolo
-                predecessors = set()
-                for state in range(num_states):
-                    if (state, symbol) in transitions and transitions[(state, symbol)] in current_set:
-                        predecessors.add(state)
+            # Marcar los predecesores moviéndolos al inicio de su bloque
+            touched = []
+            for dest in elems[first[block]:end[block]]:
+                for state in predecessors.get(dest, ()):
+                    b = block_of[state]
+                    j = loc[state]
+                    if j < mid[b]:
+                        continue
+                    k = mid[b]
+                    other = elems[k]
+                    elems[j], elems[k] = other, state
+                    loc[other], loc[state] = j, k
+                    if mid[b] == first[b]:
+                        touched.append(b)
+                    mid[b] += 1
+            
+            # Partir cada bloque tocado en marcados / no marcados
+            for b in touched:
+                if mid[b] == end[b]:
+                    mid[b] = first[b]
+                    continue
                 
-                # Actualizar particiones
-                new_partitions = []
-                for partition in partitions:
-                    intersection = partition.intersection(predecessors)
-                    difference = partition - predecessors
-                    
-                    if intersection and difference:
-                        new_partitions.append(intersection)
-                        new_partitions.append(difference)
-                        
-                        # Actualizar workset
-                        if partition in workset:
-                            workset.remove(partition)
-                            workset.append(intersection)
-                            workset.append(difference)
-                        else:
-                            if len(intersection) <= len(difference):
-                                workset.append(intersection)
-                            else:
-                                workset.append(difference)
-                    else:
-                        new_partitions.append(partition)
+                new_block = len(first)
+                first.append(first[b])
+                end.append(mid[b])
+                mid.append(first[b])
+                first[b] = mid[b]
+                for i in range(first[new_block], end[new_block]):
+                    block_of[elems[i]] = new_block
                 
-                partitions = new_partitions
+                size_old = end[b] - first[b]
+                size_new = end[new_block] - first[new_block]
+                for sym in symbols:
+                    if (b, sym) in workset:
+                        added = (new_block, sym)
+                    else:
+                        added = (new_block, sym) if size_new <= size_old else (b, sym)
+                    if added not in workset:
+                        workset.add(added)
+                        pending.append(added)
         
         # Construir el DFA minimizado
         # Mapear estados originales a nuevos estados
-        state_mapping = {}
-        for i, partition in enumerate(partitions):
-            for state in partition:
-                state_mapping[state] = i
+        state_mapping = block_of
         
         # Construir nuevas transiciones
         new_transitions = {}
@@ -343,7 +394,7 @@ class RegexToDFA:
         
         # Almacenar el DFA minimizado
         self.minimized_dfa = {
-            'states': len(partitions),
+            'states': len(first),
             'initial': new_initial,
             'final_states': new_final_states,
             'transitions': new_transitions
@@ -382,6 +433,11 @@ class RegexToDFA:
         else:
             raise ValueError("Primero debe construir el DFA")
         
+        # matplotlib solo se necesita para dibujar; el resto del módulo
+        # (construcción, minimización, benchmarks) funciona sin él
+        import matplotlib.pyplot as plt
+        import matplotlib.patches as patches
+        
         fig, ax = plt.subplots(figsize=(12, 10))
         
         # Obtener el número de estados y calcular sus posiciones en círculo
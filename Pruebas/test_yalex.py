@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Pruebas del lector de especificaciones y del parser de expresiones
+#
+#   python Pruebas/test_yalex.py      (o python -m pytest Pruebas)
+#
+# Cada prueba escribe una especificación .yal temporal, genera el lexer y
+# revisa los tokens que produce.
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from Parser import LexerGenerator, YALexParser
+
+
+def generate(spec):
+    directory = tempfile.mkdtemp()
+    spec_path = os.path.join(directory, "spec.yal")
+    lexer_path = os.path.join(directory, "spec_lexer.py")
+    with open(spec_path, 'w', encoding='utf-8') as f:
+        f.write(spec)
+    with redirect_stdout(io.StringIO()):
+        LexerGenerator(spec_path).generate_lexer(lexer_path)
+    module_spec = importlib.util.spec_from_file_location("spec_lexer", lexer_path)
+    module = importlib.util.module_from_spec(module_spec)
+    module_spec.loader.exec_module(module)
+    return spec_path, module
+
+
+def tokens(module, text):
+    return [(token.type, token.value) for token in module.Lexer(text).tokenize()][:-1]
+
+
+def test_commented_action():
+    # Los comentarios de una acción no llegan al tipo del token, aunque
+    # tengan llaves o abarquen varias líneas
+    spec_path, module = generate(
+        "rule t = 'a' { return A (* the a token *) }\n"
+        "  | 'b' { (* { not a brace } *) return B }\n"
+        "  | 'c' { return (* multi\n   line *) C }\n"
+    )
+    rules = YALexParser(spec_path).parse()['rules']
+    assert [action.split() for _, action in rules] == [["return", "A"], ["return", "B"], ["return", "C"]]
+    assert tokens(module, "abc") == [("A", "a"), ("B", "b"), ("C", "c")]
+
+
+def test_class_whitespace():
+    # Un espacio sin comillas dentro de una clase solo separa elementos
+    _, module = generate(
+        "rule t = ['a'-'z' '0'-'9']+ { return WORD }\n"
+        "  | [ 'x' - 'z' ] '!' { return BANG }\n"
+        "  | ' ' { return SPACE }\n"
+    )
+    assert tokens(module, "ab1 y!") == [("WORD", "ab1"), ("SPACE", " "), ("BANG", "y!")]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"{name}: ok")